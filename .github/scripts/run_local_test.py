@@ -20,7 +20,7 @@ script_dir = Path(__file__).parent
 sys.path.insert(0, str(script_dir))
 
 # 导入同步模块
-from sync_notion import ObsidianToNotionSync
+from sync_notion import ObsidianToNotionSync, setup_logging
 
 def main():
     print("="*60)
@@ -63,6 +63,7 @@ def main():
     print("="*60)
 
     # 执行同步
+    setup_logging()
     try:
         sync = ObsidianToNotionSync(NOTION_TOKEN, NOTION_DATABASE_ID, str(vault_path))
         sync.run()
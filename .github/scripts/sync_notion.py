@@ -14,10 +14,27 @@ Features:
 - Handles YAML frontmatter
 - Supports headings, lists, code blocks, quotes, paragraphs
 - Creates new pages or updates existing ones based on file_id
+  (existing pages are looked up from one paginated scan of the database)
+- Updates existing pages incrementally: unchanged blocks are kept, changed
+  blocks are edited in place, only the tail is deleted/re-appended
+  (if the page no longer matches, a new page is created and the old one archived;
+  set SYNC_PRESERVE_PAGE_ID=1 to clear and refill the same page instead; network
+  and server errors leave the page as is until the next sync)
+- Skips files whose content is unchanged since the last successful sync,
+  without even reading them when mtime and size match (state is kept in a
+  local SQLite database; set SYNC_FORCE=1 to sync everything). If the database
+  has an optional "content_hash" rich_text property, page hashes are kept there
+  too, so unchanged pages are still skipped after the local state is lost
+- Re-reads the database schema at most once a day (SYNC_VERIFY_SCHEMA=1 forces it)
 - Windows UTF-8 encoding support for Chinese characters and emojis
+- Syncs files concurrently (SYNC_WORKERS threads) under a shared request rate
+  limit (NOTION_RATE_LIMIT), retrying with exponential backoff (or Retry-After) on
+  rate limits, 5xx responses and network errors
+- Parses large batches of notes in parallel worker processes
 
 Requirements:
-pip install notion-client>=2.2.1,<3.0.0 httpx
+pip install -r .github/scripts/requirements.txt
+(orjson is optional and only speeds up request encoding)
 
 Notion Database Setup:
 1. Create a database in Notion
@@ -36,9 +53,24 @@ GitHub Actions Setup:
 import os
 import re
 import sys
+import json
+import mmap
+import time
+import logging
 import hashlib
+import sqlite3
+import importlib.util
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from urllib.parse import quote, unquote
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Union
+
+try:
+    import orjson  # 可选：Notion 请求体的序列化和响应解析比标准库 json 快数倍
+except ImportError:
+    orjson = None
 
 # Windows UTF-8 encoding fix for Chinese and emoji display
 if sys.platform == 'win32':
@@ -46,41 +78,610 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-try:
-    from notion_client import Client, APIResponseError
-    import httpx
-except ImportError:
-    print("Error: notion-client not installed. Run: pip install notion-client")
-    sys.exit(1)
+logger = logging.getLogger(__name__)
 
+# 日志中的分隔线
+SEPARATOR = '=' * 50
 
 # Constants
 NOTION_API_VERSION = "2022-06-28"
+NOTION_API_BASE_URL = "https://api.notion.com/v1"
 HTTP_TIMEOUT_SECONDS = 30.0
+HTTP_MAX_CONNECTIONS = 32
 MAX_NOTION_HEADING_LEVEL = 3
 FILE_ID_HASH_LENGTH = 16
 BLOCK_BATCH_SIZE = 100
+MAX_RICH_TEXT_LENGTH = 2000  # Notion 单个 rich_text 的最大长度（UTF-16 单位）
+MAX_RICH_TEXT_ITEMS = 100  # Notion 单个 block 的 rich_text 最多段数
+QUERY_PAGE_SIZE = 100
+
+# 并发与限流重试设置
+MAX_SYNC_WORKERS = 8  # 并发同步的文件数，可用 SYNC_WORKERS 覆盖
+MAX_BLOCK_WORKERS = 5  # 单个页面内并发发送的 block 删除/原地更新请求数
+
+# 待同步文件达到该数量时才启用多进程解析（进程启动本身有开销）
+PARSE_POOL_MIN_FILES = 50
+PARSE_POOL_CHUNK_SIZE = 16
+
+# 需要查询页面的文件（没有记下页面 ID）达到该数量时，一次性扫描数据库建立 file_id 索引，否则逐个查询
+PAGE_INDEX_MIN_FILES = 5
+MAX_API_RETRIES = 5
+RETRY_BASE_DELAY_SECONDS = 1.0
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# 所有线程合计的请求速率（Notion 平均限制约 3 次/秒），可用 NOTION_RATE_LIMIT 覆盖，0 表示不限
+NOTION_RATE_LIMIT = 3.0
+NOTION_RATE_BURST = 10  # 允许的短时突发请求数
+
+# 可原地更新内容的 block 类型（其他类型的变化需要删除后重新追加）
+UPDATABLE_BLOCK_TYPES = {
+    "paragraph", "heading_1", "heading_2", "heading_3",
+    "bulleted_list_item", "numbered_list_item", "to_do", "quote", "code",
+}
+
+# Notion 支持的代码语言列表
+NOTION_CODE_LANGUAGES = frozenset({
+    "abap", "abc", "agda", "arduino", "ascii art", "assembly",
+    "bash", "basic", "bnf", "c", "c#", "c++", "clojure",
+    "coffeescript", "coq", "css", "dart", "dhall", "diff",
+    "docker", "ebnf", "elixir", "elm", "erlang", "f#",
+    "flow", "fortran", "gherkin", "glsl", "go", "graphql",
+    "groovy", "haskell", "hcl", "html", "idris", "java",
+    "javascript", "json", "julia", "kotlin", "latex", "less",
+    "lisp", "livescript", "llvm ir", "lua", "makefile",
+    "markdown", "markup", "matlab", "mathematica", "mermaid",
+    "nix", "notion formula", "objective-c", "ocaml", "pascal",
+    "perl", "php", "plain text", "powershell", "prolog",
+    "protobuf", "purescript", "python", "r", "racket",
+    "reason", "ruby", "rust", "sass", "scala", "scheme",
+    "scss", "shell", "smalltalk", "solidity", "sql", "swift",
+    "toml", "typescript", "vb.net", "verilog", "vhdl",
+    "visual basic", "webassembly", "xml", "yaml", "java/c/c++/c#"
+})
+
+# 图片查找时识别的扩展名（小写）
+IMAGE_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.webp'})
+
+# Markdown 解析用的正则（模块加载时编译一次，match 本身锚定行首）
+# 同一行首字符的几种语法合并为一个带命名分组的正则，每行只匹配一次，
+# 按命中的分组区分（分支顺序即优先级：任务列表先于无序列表）
+_RE_LIST_ITEM = re.compile(r'(?P<todo>\-\s\[(?P<mark>[\sxX])\]\s*)|(?P<bullet>[\-\*]\s+)')
+_RE_IMAGE_LINE = re.compile(r'!\[\[(?P<wiki>.*?)\]\]$|!\[(?P<alt>.*?)\]\((?P<path>.*?)\)$')
+# 整体是一个捕获分组，split 时图片本身也保留在结果中
+_RE_IMAGE_INLINE = re.compile(r'(!\[\[.*?\]\]|!\[.*?\]\(.*?\))')
+
+# 由 vault 路径生成 Git 分支名用的正则
+_RE_BRANCH_INVALID_CHARS = re.compile(r'[^\w\-]')
+_RE_REPEATED_DASHES = re.compile(r'-+')
+
+# 不同步的系统文件夹（.trash 是 Obsidian 回收站，其中的笔记已被删除）
+EXCLUDED_DIRS = frozenset({'.obsidian', '.trash', '.git', '.github', 'node_modules'})
+
+# 不小于此大小（字节）的笔记用 mmap 读取，避免先复制一份完整字节再计算 hash、解码
+MMAP_MIN_FILE_SIZE = 64 * 1024
+
+# 可选的数据库属性（rich_text）：存在时把页面 hash 同时记在 Notion 页面上，
+# 本地状态丢失（如 Actions 缓存过期）后仍可跳过未变化的页面
+CONTENT_HASH_PROPERTY = "content_hash"
+
+# 本地同步状态库（相对于 vault 根目录）
+SYNC_STATE_FILE = ".github/scripts/.sync_state.db"
+SYNC_STATE_VERSION = 3  # 表结构变化时加 1，旧状态库会被重建
+SCHEMA_CACHE_TTL_SECONDS = 24 * 60 * 60  # 数据库结构检查结果的有效期
 
 # Default GitHub repository settings
 DEFAULT_GITHUB_REPO = "alon211/obsidian_public"
 DEFAULT_GITHUB_BRANCH = "main"
 
 
+def _utf16_chunks(content: str, limit: int) -> List[str]:
+    """把文本按 UTF-16 长度切成不超过 limit 的若干段
+
+    Notion 按 JavaScript 字符串长度（UTF-16 单位）检查文本长度：emoji 等 BMP 之外的字符
+    占 2 个单位，按 len() 切分会超出限制
+    """
+    if len(content) <= limit // 2:
+        return [content]
+    units = len(content.encode('utf-16-le')) // 2
+    if units <= limit:
+        return [content]
+    if units == len(content):
+        # 全是 BMP 字符，UTF-16 长度与 len() 相同
+        return [content[i:i + limit] for i in range(0, len(content), limit)]
+
+    chunks = []
+    start = 0
+    while start < len(content):
+        end = start + limit
+        while True:
+            chunk = content[start:end]
+            over = len(chunk.encode('utf-16-le')) // 2 - limit
+            if over <= 0:
+                break
+            end -= (over + 1) // 2  # 每去掉一个字符至少少 1 个单位、至多少 2 个
+        chunks.append(chunk)
+        start = end
+    return chunks
+
+
+# Notion block 构造函数
+def _rt(content: str) -> List[Dict[str, Any]]:
+    """纯文本 rich_text
+
+    超过 MAX_RICH_TEXT_LENGTH 的文本拆成多段，否则 Notion 会拒绝整个请求
+    """
+    return [
+        {"type": "text", "text": {"content": part}}
+        for part in _utf16_chunks(content, MAX_RICH_TEXT_LENGTH)
+    ]
+
+
+def _split_block_text(content: str) -> List[str]:
+    """把文本拆成单个 block 能容纳的若干段
+
+    _rt 拆出的段数超过 MAX_RICH_TEXT_ITEMS 时 Notion 同样会拒绝请求，
+    超长的段落和代码块（如压缩后的 JSON）需要拆成多个 block。
+    按 _rt 的切分结果每 MAX_RICH_TEXT_ITEMS 段合成一个 block，含 emoji 时段数同样不会超出
+    """
+    if len(content) <= MAX_RICH_TEXT_LENGTH * MAX_RICH_TEXT_ITEMS // 2:
+        return [content]
+    parts = _utf16_chunks(content, MAX_RICH_TEXT_LENGTH)
+    if len(parts) <= MAX_RICH_TEXT_ITEMS:
+        return [content]
+    return [''.join(parts[i:i + MAX_RICH_TEXT_ITEMS]) for i in range(0, len(parts), MAX_RICH_TEXT_ITEMS)]
+
+
+def _plain_text(prop: Dict[str, Any]) -> str:
+    """Notion API 返回的 rich_text 属性值的纯文本"""
+    return ''.join(rt.get('plain_text', '') for rt in prop.get('rich_text', []))
+
+
+def _para(content: str) -> Dict[str, Any]:
+    return {"type": "paragraph", "paragraph": {"rich_text": _rt(content)}}
+
+
+# 各级标题的 block 类型，按级别直接取用，不必每次格式化字符串
+_HEADING_TYPES = tuple(f"heading_{level}" for level in range(1, MAX_NOTION_HEADING_LEVEL + 1))
+
+
+def _heading(level: int, content: str) -> Dict[str, Any]:
+    block_type = _HEADING_TYPES[level - 1]
+    return {"type": block_type, block_type: {"rich_text": _rt(content)}}
+
+
+def _bullet(content: str) -> Dict[str, Any]:
+    return {"type": "bulleted_list_item", "bulleted_list_item": {"rich_text": _rt(content)}}
+
+
+def _todo(content: str, checked: bool) -> Dict[str, Any]:
+    return {"type": "to_do", "to_do": {"rich_text": _rt(content), "checked": checked}}
+
+
+def _quote(content: str) -> Dict[str, Any]:
+    return {"type": "quote", "quote": {"rich_text": _rt(content)}}
+
+
+def _code(language: str, content: str) -> Dict[str, Any]:
+    return {"type": "code", "code": {"rich_text": _rt(content), "language": language}}
+
+
+def block_hash(block: Dict[str, Any]) -> str:
+    """计算 block 内容的 hash
+
+    只取影响显示的字段（类型、文本、勾选状态、代码语言、图片 URL），
+    本地生成的 block 和 Notion API 返回的 block 得到相同的结果
+    """
+    block_type = block.get('type')
+    data = block.get(block_type) or {}
+    text = ''.join(
+        rt.get('text', {}).get('content', rt.get('plain_text', ''))
+        for rt in data.get('rich_text', [])
+    )
+    url = (data.get('external') or {}).get('url')
+    normalized = [block_type, text, data.get('checked'), data.get('language'), url]
+    encoded = json.dumps(normalized, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded, usedforsecurity=False).hexdigest()[:FILE_ID_HASH_LENGTH]
+
+
+def page_hash(title: str, blocks: List[Dict[str, Any]]) -> str:
+    """计算整个页面（标题和全部 blocks）的 hash
+
+    markdown 改了但生成的页面完全相同时（如只改了 frontmatter 或行尾空格），可以跳过同步
+    """
+    hasher = hashlib.sha256(f"{title}\n".encode('utf-8'), usedforsecurity=False)
+    hasher.update(json.dumps(blocks, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    """接口错误的 HTTP 状态码：notion_client 的错误带 status，httpx 的错误带 response.status_code"""
+    return getattr(error, 'status', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+
+
+def _is_gone_error(error: Exception) -> bool:
+    """block 是否已不存在：404，或对已归档（已删除）的 block 操作时 Notion 返回的 400 validation_error"""
+    status = _error_status(error)
+    if status == 404:
+        return True
+    if status != 400:
+        return False
+    try:
+        body = error.response.json()
+    except Exception:
+        return False
+    return body.get('code') == 'validation_error' and 'archived' in body.get('message', '')
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """是否为临时性错误（限流、5xx、超时等网络错误），与页面内容无关，稍后重试可能成功"""
+    import httpx
+    from notion_client.errors import RequestTimeoutError
+
+    return (_error_status(error) in RETRYABLE_STATUS_CODES
+            or isinstance(error, (httpx.TransportError, RequestTimeoutError)))
+
+
+class RateLimiter:
+    """线程安全的令牌桶限流器
+
+    所有同步线程共用一个实例，主动把请求速率控制在限制以内，
+    而不是等到被 429 拒绝后再退避
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，令牌不足时等待
+
+        令牌数允许为负：每个线程在锁内预约自己的时间片，在锁外等待，
+        等待期间不会挡住其他线程预约
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """被 Notion 限流（429）后让所有线程一起暂停：之后取到的令牌至少要等 seconds 秒
+
+        只让收到 429 的线程退避没有用，其他线程照常发送请求，仍会继续被限流
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class SyncCache:
+    """本地同步状态（SQLite）
+
+    - files: 每个 markdown 文件上次成功同步时的 mtime/size、内容 hash、页面 ID、页面 hash
+      和当时 vault 中附件列表的 hash。附件列表没变时：mtime 和 size 都没变时连文件都不用读，
+      内容 hash 相同时跳过同步；内容变了但生成的页面 hash 相同时也跳过；
+      已知页面 ID 时省去一次数据库查询
+    - page_blocks: 每个 Notion 页面当前的 block 列表 (block_id, type, hash)，
+      增量更新时可以直接与新内容比较，省去 blocks.children.list 请求
+    - meta: scope 以及上次检查的数据库结构等零散信息
+
+    状态与 scope（database_id、仓库和分支）绑定，scope 变化时自动清空。
+    所有写入在 close() 时一次提交；touch_file 的更新先攒起来，再用 executemany 批量写入。
+    """
+
+    _SCHEMA = """
+        DROP TABLE IF EXISTS meta;
+        DROP TABLE IF EXISTS files;
+        DROP TABLE IF EXISTS page_blocks;
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE files (
+            rel_path TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            size INTEGER,
+            content_hash TEXT,
+            file_id TEXT,
+            page_id TEXT,
+            blocks_hash TEXT,
+            attachments_hash TEXT
+        );
+        CREATE TABLE page_blocks (
+            page_id TEXT,
+            position INTEGER,
+            block_id TEXT,
+            type TEXT,
+            hash TEXT,
+            PRIMARY KEY (page_id, position)
+        );
+    """
+
+    def __init__(self, path: Path, scope: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # 尚未写入的 touch_file 更新：(mtime_ns, size, rel_path)
+        self._pending_touches: List[Tuple[int, int, str]] = []
+
+        try:
+            self._db = self._open(path, scope)
+        except sqlite3.DatabaseError as e:
+            # 状态库已损坏：删除后从空状态开始
+            logger.warning("[Warning] Sync state unreadable, starting fresh: %s", e)
+            path.unlink(missing_ok=True)
+            self._db = self._open(path, scope)
+
+    @classmethod
+    def _open(cls, path: Path, scope: str) -> sqlite3.Connection:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 多个同步线程共用一个连接，访问由 self._lock 串行化
+        db = sqlite3.connect(str(path), check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+
+        if db.execute("PRAGMA user_version").fetchone()[0] != SYNC_STATE_VERSION:
+            db.executescript(cls._SCHEMA + f"PRAGMA user_version = {SYNC_STATE_VERSION};")
+
+        row = db.execute("SELECT value FROM meta WHERE key = 'scope'").fetchone()
+        if row is None or row[0] != scope:
+            with db:
+                db.execute("DELETE FROM meta")
+                db.execute("DELETE FROM files")
+                db.execute("DELETE FROM page_blocks")
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('scope', ?)", (scope,))
+        return db
+
+    def _flush_touches(self):
+        """写入攒下的 touch_file 更新（调用方需持有 self._lock）"""
+        if self._pending_touches:
+            self._db.executemany(
+                "UPDATE files SET mtime_ns = ?, size = ? WHERE rel_path = ?", self._pending_touches
+            )
+            self._pending_touches.clear()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def get_file(self, rel_path: str) -> Optional[sqlite3.Row]:
+        """上次成功同步时的记录 (mtime_ns, size, content_hash, file_id, page_id, blocks_hash, attachments_hash)"""
+        with self._lock:
+            self._flush_touches()
+            return self._db.execute(
+                "SELECT * FROM files WHERE rel_path = ?", (rel_path,)
+            ).fetchone()
+
+    def set_file(self, rel_path: str, file_stat: os.stat_result, content_hash: str,
+                 file_id: str, page_id: Optional[str], blocks_hash: str, attachments_hash: str):
+        with self._lock:
+            self._flush_touches()
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (rel_path, file_stat.st_mtime_ns, file_stat.st_size, content_hash,
+                 file_id, page_id, blocks_hash, attachments_hash)
+            )
+
+    def touch_file(self, rel_path: str, file_stat: os.stat_result):
+        """内容没变、只有 mtime 变了（例如重新 checkout）时更新 mtime/size
+
+        重新 checkout 后几乎每个文件都会走到这里，先攒起来，之后一次批量写入
+        """
+        with self._lock:
+            self._pending_touches.append((file_stat.st_mtime_ns, file_stat.st_size, rel_path))
+
+    def drop_file(self, rel_path: str):
+        with self._lock:
+            self._flush_touches()
+            self._db.execute("DELETE FROM files WHERE rel_path = ?", (rel_path,))
+
+    def get_page_blocks(self, page_id: str) -> Optional[List[List[str]]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT block_id, type, hash FROM page_blocks WHERE page_id = ? ORDER BY position",
+                (page_id,)
+            ).fetchall()
+        return [list(row) for row in rows] or None
+
+    def set_page_blocks(self, page_id: str, entries: List[List[str]]):
+        with self._lock:
+            self._db.execute("DELETE FROM page_blocks WHERE page_id = ?", (page_id,))
+            self._db.executemany(
+                "INSERT INTO page_blocks VALUES (?, ?, ?, ?, ?)",
+                [(page_id, position, *entry) for position, entry in enumerate(entries)]
+            )
+
+    def drop_page(self, page_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM page_blocks WHERE page_id = ?", (page_id,))
+
+    def prune(self, rel_paths: Iterable[str]) -> int:
+        """删除 vault 中已不存在的文件的记录，以及不再被任何文件引用的页面 blocks
+
+        笔记被删除或改名后旧记录不会再被用到，不清理的话状态库会一直变大
+
+        Returns:
+            删除的文件记录数
+        """
+        keep = set(rel_paths)
+        with self._lock:
+            self._flush_touches()
+            stale = [(row[0],) for row in self._db.execute("SELECT rel_path FROM files")
+                     if row[0] not in keep]
+            self._db.executemany("DELETE FROM files WHERE rel_path = ?", stale)
+            self._db.execute(
+                "DELETE FROM page_blocks WHERE page_id NOT IN "
+                "(SELECT page_id FROM files WHERE page_id IS NOT NULL)"
+            )
+        return len(stale)
+
+    def close(self):
+        """提交本次运行的全部写入并关闭状态库"""
+        with self._lock:
+            try:
+                self._flush_touches()
+                self._db.commit()
+                self._db.close()
+            except sqlite3.Error as e:
+                logger.warning("[Warning] Could not save sync state: %s", e)
+
+
+class LogBuffer(logging.Filter):
+    """按线程缓冲日志：多个文件并发同步时，每个文件的日志处理完后整段输出，不会互相交错
+
+    作为 filter 挂在 logger 上：当前线程处于 capture() 中时记录被攒下（返回 False 不输出），
+    否则照常输出
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        records = getattr(self._local, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    @contextmanager
+    def capture(self):
+        """with 块内当前线程的日志先缓冲，结束时一次性输出（持锁，保证整段连续）"""
+        self._local.records = []
+        try:
+            yield
+        finally:
+            records = self._local.records
+            self._local.records = None
+            with self._lock:
+                for record in records:
+                    logger.handle(record)
+
+    def bind(self, func):
+        """包装 func：在其他线程（如单个页面内的并发请求）中运行时，日志记入当前线程的缓冲
+
+        在 capture() 之外调用时原样返回 func
+        """
+        records = getattr(self._local, 'records', None)
+        if records is None:
+            return func
+
+        def wrapper(*args, **kwargs):
+            previous = getattr(self._local, 'records', None)
+            self._local.records = records
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.records = previous
+        return wrapper
+
+
+_log_buffer = LogBuffer()
+logger.addFilter(_log_buffer)
+
+
+def setup_logging():
+    """配置日志输出：只输出消息本身，级别由环境变量 LOG_LEVEL 控制（默认 INFO，DEBUG 显示调试信息）"""
+    logging.basicConfig(
+        level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+        format='%(message)s',
+        stream=sys.stdout
+    )
+    # httpx 会为每个请求输出一行 INFO 日志，太多了
+    for name in ('httpx', 'httpcore'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+# 解析子进程中使用的同步实例（由 _init_parse_worker 设置）
+_worker_sync = None
+
+
+def _init_parse_worker(sync: 'ObsidianToNotionSync'):
+    """解析子进程初始化：每个进程只接收一次同步实例"""
+    global _worker_sync
+    _worker_sync = sync
+    setup_logging()  # spawn 方式启动的子进程不会继承主进程的日志配置
+
+
+def _parse_note_job(job: Tuple[Path, str]) -> Tuple[str, List[Dict[str, Any]]]:
+    """在解析子进程中解析单个文件"""
+    markdown_file, content = job
+    return _worker_sync.parse_note(markdown_file, content)
+
+
 class ObsidianToNotionSync:
     """Sync Obsidian vault to Notion database using unique file ID"""
 
     def __init__(self, token: str, database_id: str, vault_path: str):
-        self.notion = Client(auth=token)
+        # 延迟导入：notion_client（连带 httpx 等）只在真正同步时才加载，
+        # 配置缺失等提前退出的情况不必付出导入开销
+        try:
+            from notion_client import Client
+            import httpx
+        except ImportError:
+            logger.error("Error: notion-client not installed. Run: pip install -r .github/scripts/requirements.txt")
+            sys.exit(1)
+
+        # 整个同步过程共用一个连接池，复用 TCP/TLS 连接；安装了 h2 时启用 HTTP/2
+        self._http_client = httpx.Client(
+            http2=importlib.util.find_spec('h2') is not None,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS
+            )
+        )
+        self.notion = Client(auth=token, client=self._http_client)
         self.token = token  # 保存 token 用于 HTTP API
+        # 直接调用 HTTP API 的请求头（会覆盖 notion_client 设在共享连接池上的默认请求头）
+        self._api_headers = {
+            "Authorization": f"Bearer {token}",
+            "Notion-Version": NOTION_API_VERSION,
+            "Content-Type": "application/json"
+        }
         self.database_id = database_id
         self.vault_path = Path(vault_path)
-
-        # 调试：打印 Client 类型
-        print(f"[Debug] Notion Client type: {type(self.notion)}")
-        print(f"[Debug] Has databases attr: {hasattr(self.notion, 'databases')}")
-        if hasattr(self.notion, 'databases'):
-            print(f"[Debug] Databases type: {type(self.notion.databases)}")
-            print(f"[Debug] Has query attr: {hasattr(self.notion.databases, 'query')}")
+        self.force_sync = os.environ.get('SYNC_FORCE') == '1'
+        # 整页重写时保留原页面（及指向它的 Notion 链接），而不是归档后重新创建
+        self.preserve_page_id = os.environ.get('SYNC_PRESERVE_PAGE_ID') == '1'
+        # 不使用缓存的数据库结构，重新读取一次（强制同步时同样重新读取）
+        self.verify_schema = self.force_sync or os.environ.get('SYNC_VERIFY_SCHEMA') == '1'
+
+        self.sync_workers = max(1, int(os.environ.get('SYNC_WORKERS', MAX_SYNC_WORKERS)))
+        rate = float(os.environ.get('NOTION_RATE_LIMIT', NOTION_RATE_LIMIT))
+        self._rate_limiter = RateLimiter(rate, NOTION_RATE_BURST) if rate > 0 else None
+
+        # file_id → 页面 ID，由 load_page_index 一次性建立；None 表示逐个查询
+        self._page_index: Optional[Dict[str, str]] = None
+        # file_id 属性的 ID（run() 读取数据库结构时记下），建立索引时只请求这一个属性
+        self._file_id_property: Optional[str] = None
+        # 数据库是否有 CONTENT_HASH_PROPERTY 属性及其 ID（同样由 run() 检测）
+        self._has_hash_property = False
+        self._hash_property: Optional[str] = None
+        # file_id → 页面上记录的页面 hash，与 _page_index 一起建立
+        self._remote_hashes: Dict[str, str] = {}
+
+        # vault 文件索引 {小写文件名: [完整路径, ...]}，由 _vault_file_index 首次使用时建立
+        self._file_index: Optional[Dict[str, List[str]]] = None
+        # vault 中所有非 markdown 文件（图片等附件）路径列表的 hash，与 _file_index 一起建立。
+        # 附件增删或移动会改变图片的解析结果，此时不能只凭笔记内容没变就跳过
+        self._attachments_hash: Optional[str] = None
+
+        # (markdown 目录, 图片引用) → 图片 URL（文件不存在时为 None），同一图片被多次引用时只解析一次
+        self._image_cache: Dict[Tuple[Path, str], Optional[str]] = {}
+
+        # (markdown 目录, 正文) → Notion blocks，正文相同的笔记（如同一模板生成的）只转换一次
+        self._blocks_cache: Dict[Tuple[Path, str], List[Dict[str, Any]]] = {}
 
         # GitHub 仓库配置（从环境变量获取，支持默认值）
         self.github_repo = os.environ.get('GITHUB_REPO', DEFAULT_GITHUB_REPO)
@@ -89,10 +690,29 @@ class ObsidianToNotionSync:
         manual_branch = os.environ.get('GITHUB_BRANCH')
         if manual_branch:
             self.github_branch = manual_branch
-            print(f"[Debug] Using manual branch: {manual_branch}")
+            logger.debug("[Debug] Using manual branch: %s", manual_branch)
         else:
             self.github_branch = self._calculate_branch_for_vault()
 
+        # 图片 URL 依赖仓库和分支，所以同步状态同时与数据库、仓库和分支绑定
+        self.cache = SyncCache(
+            self.vault_path / SYNC_STATE_FILE,
+            f"{database_id}\n{self.github_repo}\n{self.github_branch}"
+        )
+
+        # 图片 URL 前缀和 vault 绝对路径前缀，生成图片 URL 时直接拼接
+        self._gh_prefix = f"https://raw.githubusercontent.com/{self.github_repo}/{self.github_branch}/"
+        self._vault_prefix = os.path.join(os.path.abspath(self.vault_path), '')
+
+    def __getstate__(self):
+        """传给解析子进程时不带 Notion 客户端和同步缓存（含连接/锁，无法 pickle）"""
+        state = self.__dict__.copy()
+        state['notion'] = None
+        state['_http_client'] = None
+        state['cache'] = None
+        state['_rate_limiter'] = None
+        return state
+
     def _calculate_branch_for_vault(self) -> str:
         """根据 vault_path 计算对应的 GitHub 分支名
 
@@ -133,12 +753,11 @@ class ObsidianToNotionSync:
 
         # 转换为有效的 Git 分支名
         # 替换特殊字符为连字符
-        import re
-        branch_name = re.sub(r'[^\w\-]', '-', branch_name)
+        branch_name = _RE_BRANCH_INVALID_CHARS.sub('-', branch_name)
         branch_name = branch_name.strip('-')
 
         # 移除连续的连字符
-        branch_name = re.sub(r'-+', '-', branch_name)
+        branch_name = _RE_REPEATED_DASHES.sub('-', branch_name)
 
         # 限制长度（GitHub 分支名限制）
         if len(branch_name) > 240:
@@ -150,8 +769,8 @@ class ObsidianToNotionSync:
 
         # 调试输出
         if branch_name != 'main':
-            print(f"[Debug] Using branch '{branch_name}' for vault")
-            print(f"[Debug] Original path: {vault_str}")
+            logger.debug("[Debug] Using branch '%s' for vault", branch_name)
+            logger.debug("[Debug] Original path: %s", vault_str)
 
         return branch_name
 
@@ -177,11 +796,73 @@ class ObsidianToNotionSync:
         # 转换为正斜杠（跨平台一致性）
         path_str = str(relative_path).replace('\\', '/')
 
-        # 生成 SHA256 hash 并取前 FILE_ID_HASH_LENGTH 位
-        file_id = hashlib.sha256(path_str.encode('utf-8')).hexdigest()[:FILE_ID_HASH_LENGTH]
+        # 生成 SHA256 hash（只作标识，与安全无关）并取前 FILE_ID_HASH_LENGTH 位
+        file_id = hashlib.sha256(path_str.encode('utf-8'), usedforsecurity=False).hexdigest()[:FILE_ID_HASH_LENGTH]
 
         return file_id
 
+    def _call_api(self, func, *, idempotent: bool = True, **kwargs):
+        """调用 Notion API：先经过全局限流器，遇到临时性错误时按指数退避重试
+
+        429 限流、5xx 服务端错误和网络错误（超时、连接失败）都会重试，响应带 Retry-After 时按它等待。
+        不能重复发送的请求（新建页面、追加 blocks）只在请求肯定没被处理时（429、连接失败）重试，
+        以免超时后重发造成重复的页面或内容
+
+        Args:
+            func: self._http_request 或 notion_client 的接口方法（如 self.notion.pages.create）
+            idempotent: 请求能否安全地重复发送
+            **kwargs: 传给接口方法的参数
+
+        Returns:
+            接口返回值
+        """
+        for attempt in range(MAX_API_RETRIES):
+            if self._rate_limiter:
+                self._rate_limiter.acquire()
+            try:
+                return func(**kwargs)
+            except Exception as e:
+                import httpx
+
+                # notion_client 的错误带 status/headers，httpx 的错误带 response
+                response = getattr(e, 'response', None)
+                status = _error_status(e)
+                if status == 429 or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+                    retryable = True
+                else:
+                    retryable = idempotent and _is_transient_error(e)
+                if not retryable or attempt == MAX_API_RETRIES - 1:
+                    raise
+
+                delay = RETRY_BASE_DELAY_SECONDS * (2 ** attempt)
+                headers = getattr(e, 'headers', None) or getattr(response, 'headers', None) or {}
+                try:
+                    delay = float(headers.get('Retry-After', delay))
+                except ValueError:
+                    pass  # HTTP 日期格式的 Retry-After，仍按指数退避
+
+                if status == 429:
+                    logger.warning("    [Retry] Rate limited, retrying in %.1fs", delay)
+                    if self._rate_limiter:
+                        # 清空共用的令牌桶，重试和其他线程的请求都推迟到退避结束之后
+                        self._rate_limiter.pause(delay)
+                    else:
+                        time.sleep(delay)
+                else:
+                    logger.warning("    [Retry] %s, retrying in %.1fs",
+                                   f"HTTP {status}" if status else type(e).__name__, delay)
+                    time.sleep(delay)
+
+    def _content_hash(self, data: Union[bytes, mmap.mmap]) -> str:
+        """计算文件内容（原始字节）的 hash
+
+        图片 URL 依赖仓库和分支，所以二者也计入 hash，切换分支后会重新同步
+        """
+        hasher = hashlib.sha256(f"{self.github_repo}\n{self.github_branch}\n".encode('utf-8'),
+                                usedforsecurity=False)
+        hasher.update(data)
+        return hasher.hexdigest()
+
     def find_image_path(self, markdown_dir: Path, image_ref: str) -> Optional[str]:
         """查找图片文件的完整路径
 
@@ -189,113 +870,140 @@ class ObsidianToNotionSync:
         - [[Pasted image 20260217085700.png]]
         - [[./images/photo.png]]
         """
-        # 去掉 [[]] 包裹
-        clean_name = image_ref.strip('[]!')
-
-        # 去掉可能的路径前缀
-        clean_name = Path(clean_name).name
-
-        # 检查 images 子文件夹 (Obsidian 默认图片附件位置)
-        images_dir = markdown_dir / "images"
-        if images_dir.exists():
-            for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.PNG', '.JPG', '.JPEG']:
-                img_path = images_dir / (clean_name + ext)
-                if img_path.exists():
-                    return str(img_path)
-
-        # 检查附件文件夹
-        attachments_dir = markdown_dir / "attachments"
-        if attachments_dir.exists():
-            for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.PNG', '.JPG', '.JPEG']:
-                img_path = attachments_dir / (clean_name + ext)
-                if img_path.exists():
-                    return str(img_path)
-
-        # 检查同级目录
-        for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.PNG', '.JPG', '.JPEG']:
-            img_path = markdown_dir / (clean_name + ext)
-            if img_path.exists():
-                return str(img_path)
+        # 去掉 [[]] 包裹和可能的路径前缀，忽略大小写
+        clean_name = Path(image_ref.strip('[]!')).name.lower()
+        candidates = self._vault_file_index().get(clean_name)
+        if not candidates:
+            return None
 
-        return None
+        # 依次检查 images 子文件夹 (Obsidian 默认图片附件位置)、附件文件夹、同级目录
+        for directory in (markdown_dir / "images", markdown_dir / "attachments", markdown_dir):
+            directory = os.path.abspath(directory)
+            for candidate in candidates:
+                if os.path.dirname(candidate) == directory:
+                    return candidate
+
+        # 都没有时像 Obsidian 一样在整个 vault 中按文件名查找，同名时取离笔记最近的一个
+        images = [c for c in candidates if os.path.splitext(c)[1].lower() in IMAGE_EXTENSIONS]
+        if not images:
+            return None
+        note_dir = os.path.abspath(markdown_dir)
+        return max(images, key=lambda c: len(os.path.commonpath([c, note_dir])))
+
+    def _vault_file_index(self) -> Dict[str, List[str]]:
+        """获取 vault 中所有文件的索引
 
-    def upload_image_to_notion(self, image_path: str) -> Optional[str]:
-        """上传图片到 Notion
+        首次使用时遍历整个 vault 一次（见 _scan_vault），
+        之后查找图片只需查字典，不再逐个 exists() 探测。
+        图片文件也可以用不带扩展名的小写主文件名查到（Obsidian 常见写法）。
 
-        使用 GitHub Raw URL 作为外部图片
-        需要设置环境变量: GITHUB_REPO (格式: username/repo)
+        Returns:
+            {小写文件名或图片主文件名: [完整路径, ...]}，同一目录内按文件名排序
         """
-        try:
-            print(f"  [Image] Processing: {Path(image_path).name}")
+        if self._file_index is None:
+            self._scan_vault()
+        return self._file_index
 
-            # 计算相对于仓库根目录的路径
-            try:
-                rel_path = Path(image_path).relative_to(self.vault_path)
-                print(f"    [Image] Relative path: {rel_path}")
-            except ValueError:
-                rel_path = Path(image_path).name
-                print(f"    [Image] Using filename only: {rel_path}")
+    def _vault_attachments_hash(self) -> str:
+        """vault 中附件（非 markdown 文件）路径列表的 hash，首次使用时遍历 vault"""
+        if self._attachments_hash is None:
+            self._scan_vault()
+        return self._attachments_hash
 
-            # 使用实例变量中的 GitHub 仓库配置
-            github_repo = self.github_repo
-            github_branch = self.github_branch
+    def _scan_vault(self) -> List[str]:
+        """用 os.scandir 遍历整个 vault 一次（跳过 EXCLUDED_DIRS），建立文件索引
 
-            # 转换为 GitHub Raw URL
-            # 将反斜杠转换为正斜杠
-            rel_path_str = str(rel_path).replace('\\', '/')
+        同一次遍历顺便收集 markdown 文件，查找笔记和查找图片不必各扫一遍
 
-            # URL 编码中文字符 - 使用 safe 参数避免编码斜杠
-            from urllib.parse import quote
-            rel_path_encoded = quote(rel_path_str, safe='/')
+        Returns:
+            markdown 文件相对于 vault 的路径，顺序与 os.walk 相同（按名称排序、深度优先）
+        """
+        index: Dict[str, List[str]] = {}
+        markdown_files = []
+        attachments = hashlib.sha256(usedforsecurity=False)
+        prefix_len = len(self._vault_prefix)
+        pending_dirs = [os.path.abspath(self.vault_path)]
+        while pending_dirs:
+            try:
+                with os.scandir(pending_dirs.pop()) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                continue  # 目录无法读取
+
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in EXCLUDED_DIRS:
+                        subdirs.append(entry.path)
+                elif entry.is_file():
+                    name = entry.name.lower()
+                    index.setdefault(name, []).append(entry.path)
+                    stem, ext = os.path.splitext(name)
+                    if ext in IMAGE_EXTENSIONS:
+                        index.setdefault(stem, []).append(entry.path)
+                    if entry.name.endswith('.md'):
+                        markdown_files.append(entry.path[prefix_len:])
+                    else:
+                        attachments.update(entry.path[prefix_len:].encode('utf-8', 'surrogateescape') + b'\n')
+            # 倒序入栈，出栈时按名称顺序进入子目录
+            pending_dirs.extend(reversed(subdirs))
+
+        self._file_index = index
+        self._attachments_hash = attachments.hexdigest()
+        return markdown_files
+
+    def _indexed_path(self, path: Path) -> Optional[str]:
+        """path 存在于 vault 文件索引中时返回其规范化的绝对路径（代替 exists()）"""
+        target = os.path.abspath(path)
+        for candidate in self._vault_file_index().get(path.name.lower(), ()):
+            if candidate == target:
+                return candidate
+        return None
 
-            github_raw_url = f"https://raw.githubusercontent.com/{github_repo}/{github_branch}/{rel_path_encoded}"
+    def upload_image_to_notion(self, image_path: str) -> str:
+        """生成图片的 GitHub Raw URL，在 Notion 中作为外部图片显示
 
-            print(f"  [Image] GitHub URL created (length: {len(github_raw_url)})")
-            return github_raw_url
+        仓库和分支来自 GITHUB_REPO / GITHUB_BRANCH，URL 前缀在初始化时已拼好
+        """
+        if image_path.startswith(self._vault_prefix):
+            rel_path = image_path[len(self._vault_prefix):]
+        else:
+            # 不在仓库中的图片只能按文件名处理
+            rel_path = os.path.basename(image_path)
 
-        except Exception as e:
-            print(f"  [Error] Failed to process image: {type(e).__name__}")
-            print(f"  [Error] Message: {str(e)[:200]}")
-            import traceback
-            traceback.print_exc()
-            return None
+        # URL 编码中文字符，保留斜杠
+        github_raw_url = self._gh_prefix + quote(rel_path.replace(os.sep, '/'), safe='/')
+        logger.debug("  [Image] %s → %s", rel_path, github_raw_url)
+        return github_raw_url
 
-    def _process_image_block(self, image_path: str, markdown_dir: Path, alt_text: str = None) -> Dict[str, Any]:
+    def _process_image_block(self, image_path: str, markdown_dir: Path) -> Dict[str, Any]:
         """处理单个图片并返回适当的 Notion 块
 
         Args:
             image_path: 图片路径（相对于 markdown 文件）
             markdown_dir: markdown 文件所在目录
-            alt_text: 替代文本（可选）
 
         Returns:
-            Notion 块字典（图片块或占位符段落块）
-        """
-        # 解析图片完整路径
-        full_image_path = self._resolve_image_path(markdown_dir, image_path)
-
-        if full_image_path and Path(full_image_path).exists():
-            # 尝试上传图片到 Notion
-            image_url = self.upload_image_to_notion(full_image_path)
-            if image_url:
-                return {
-                    "type": "image",
-                    "image": {
-                        "type": "external",
-                        "external": {"url": image_url}
-                    }
-                }
-            else:
-                # 上传失败，使用占位符
-                placeholder_text = f"[📷 {alt_text or Path(full_image_path).name}]"
+            Notion 块字典（图片块，图片文件不存在时为警告占位符段落块）
+        """
+        # 解析图片完整路径并生成 URL（结果按目录和引用缓存，_resolve_image_path 已确认文件存在）
+        key = (markdown_dir, image_path)
+        if key in self._image_cache:
+            image_url = self._image_cache[key]
         else:
+            full_image_path = self._resolve_image_path(markdown_dir, image_path)
+            image_url = self.upload_image_to_notion(full_image_path) if full_image_path else None
+            self._image_cache[key] = image_url
+
+        if image_url is None:
             # 图片文件不存在，使用警告占位符
-            placeholder_text = f"[⚠️ {image_path}]"
+            return _para(f"[⚠️ {image_path}]")
 
         return {
-            "type": "paragraph",
-            "paragraph": {
-                "rich_text": [{"type": "text", "text": {"content": placeholder_text}}]
+            "type": "image",
+            "image": {
+                "type": "external",
+                "external": {"url": image_url}
             }
         }
 
@@ -326,316 +1034,302 @@ class ObsidianToNotionSync:
         # 转换为 Path 对象
         img_path = Path(image_path)
 
-        # 如果是绝对路径，直接返回
+        # 如果是绝对路径，直接返回（vault 内的文件查索引即可，vault 外的才需要 stat）
         if img_path.is_absolute():
+            if os.path.abspath(img_path).startswith(self._vault_prefix):
+                return self._indexed_path(img_path)
             return str(img_path) if img_path.exists() else None
 
-        # 相对路径：相对于 markdown 文件所在目录
+        # 相对路径：相对于 markdown 文件所在目录（查 vault 文件索引，不逐个 stat）
         full_path = markdown_dir / img_path
+        found_path = self._indexed_path(full_path)
+
+        logger.debug("    [Debug] Resolving: %s", image_path)
+        logger.debug("    [Debug] markdown_dir: %s", markdown_dir)
+        logger.debug("    [Debug] full_path: %s", full_path)
+        logger.debug("    [Debug] exists: %s", found_path is not None)
 
-        print(f"    [Debug] Resolving: {image_path}")
-        print(f"    [Debug] markdown_dir: {markdown_dir}")
-        print(f"    [Debug] full_path: {full_path}")
-        print(f"    [Debug] exists: {full_path.exists()}")
-
-        if full_path.exists():
-            return str(full_path)
-
-        # 如果直接找不到，尝试其他可能的路径
-        # 检查 images 文件夹
-        images_path = markdown_dir / "images" / img_path.name
-        if images_path.exists():
-            print(f"    [Debug] Found in images/: {images_path}")
-            return str(images_path)
-
-        # 检查 assets 文件夹
-        assets_path = markdown_dir / "assets" / img_path.name
-        if assets_path.exists():
-            print(f"    [Debug] Found in assets/: {assets_path}")
-            return str(assets_path)
-
-        # 检查 attachments 文件夹
-        attachments_path = markdown_dir / "attachments" / img_path.name
-        if attachments_path.exists():
-            print(f"    [Debug] Found in attachments/: {attachments_path}")
-            return str(attachments_path)
+        if found_path:
+            return found_path
+
+        # 如果直接找不到，依次检查 images、assets、attachments 文件夹
+        for folder in ("images", "assets", "attachments"):
+            found_path = self._indexed_path(markdown_dir / folder / img_path.name)
+            if found_path:
+                logger.debug("    [Debug] Found in %s/: %s", folder, found_path)
+                return found_path
+
+        # 按文件名（可省略扩展名，Obsidian 常见写法）在候选目录中查找，再退到整个 vault
+        found_path = self.find_image_path(markdown_dir, image_path)
+        if found_path:
+            logger.debug("    [Debug] Found by name: %s", found_path)
+            return found_path
 
         # 打印调试信息
-        print(f"    [Debug] Image not found: {image_path}")
-        print(f"    [Debug] Tried: {full_path}")
+        logger.debug("    [Debug] Image not found: %s", image_path)
+        logger.debug("    [Debug] Tried: %s", full_path)
 
         return None
 
-    def convert_obsidian_to_notion_blocks(self, markdown_content: str, markdown_dir: Path) -> List[Dict[str, Any]]:
+    def convert_obsidian_to_notion_blocks(self, lines: List[str], markdown_dir: Path) -> List[Dict[str, Any]]:
         """将 Obsidian Markdown 转换为 Notion blocks
 
+        Args:
+            lines: markdown 正文的各行（不含换行符和 YAML frontmatter，见 parse_note）
+            markdown_dir: markdown 文件所在目录
+
         支持的语法:
         - # 标题
         - - / * 无序列表
+        - - [ ] 任务列表
         - > 引用
         - ``` 代码块
         - ![[图片]] (Obsidian wiki-link)
         - [[内部链接]]
         """
         blocks = []
-        lines = markdown_content.split('\n')
-        i = 0
 
-        print(f"  [Debug] Converting markdown: {len(lines)} lines")
+        logger.debug("  [Debug] Converting markdown: %s lines", len(lines))
 
-        while i < len(lines):
-            line = lines[i].rstrip()
+        # 逐行迭代；代码块等跨行的语法由处理函数从同一个迭代器继续取行
+        line_iter = iter(lines)
+        for line in line_iter:
+            line = line.rstrip()
 
-            # 跳过 YAML frontmatter
-            if line == '---' and i == 0:
-                i += 1
-                while i < len(lines) and lines[i].strip() != '---':
-                    i += 1
-                i += 1
+            # 跳过空行（行尾已去掉空白，只需再去掉行首）
+            stripped = line.lstrip()
+            if not stripped:
                 continue
 
-            # 跳过空行
-            if not line.strip():
-                i += 1
+            # 按行首字符分派给对应的处理函数，处理函数返回 False 表示不是该语法
+            handler = self._LINE_HANDLERS.get(stripped[0])
+            if handler and handler(self, line_iter, line, blocks, markdown_dir):
                 continue
 
-            # 处理标题
-            if line.startswith('#'):
-                level = len(line) - len(line.lstrip('#'))
-                level = min(level, MAX_NOTION_HEADING_LEVEL)  # Notion 只支持 h1-h3
-                content = line.lstrip('#').strip()
-                block_type = f"heading_{level}"
-                blocks.append({
-                    "type": block_type,
-                    block_type: {
-                        "rich_text": [{"type": "text", "text": {"content": content}}]
-                    }
-                })
-                i += 1
-                continue
+            # 其余都按普通段落处理（可能包含内联图片）
+            self._handle_paragraph(line, blocks, markdown_dir)
 
-            # 处理无序列表
-            if re.match(r'^[\-\*]\s+', line):
-                content = re.sub(r'^[\-\*]\s+', '', line)
-                blocks.append({
-                    "type": "bulleted_list_item",
-                    "bulleted_list_item": {
-                        "rich_text": [{"type": "text", "text": {"content": content}}]
-                    }
-                })
-                i += 1
-                continue
+        logger.debug("  [Debug] Total blocks generated: %s", len(blocks))
+        return blocks
 
-            # 处理任务列表 - [ ]
-            if re.match(r'^\-\s\[[\sx]\]', line):
-                is_checked = '[x]' in line.lower()
-                content = re.sub(r'^\-\s\[[\sx]\]\s*', '', line)
-                blocks.append({
-                    "type": "to_do",
-                    "to_do": {
-                        "rich_text": [{"type": "text", "text": {"content": content}}],
-                        "checked": is_checked
-                    }
-                })
-                i += 1
-                continue
+    def _handle_heading(self, line_iter: Iterator[str], line: str,
+                        blocks: List[Dict[str, Any]], markdown_dir: Path) -> bool:
+        """处理标题 # / ## / ###"""
+        if not line.startswith('#'):
+            return False
 
-            # 处理代码块
-            if line.strip().startswith('```'):
-                lang = line.strip()[3:].strip() or "plain text"
-
-                # Notion 支持的代码语言列表
-                notion_langs = {
-                    "abap", "abc", "agda", "arduino", "ascii art", "assembly",
-                    "bash", "basic", "bnf", "c", "c#", "c++", "clojure",
-                    "coffeescript", "coq", "css", "dart", "dhall", "diff",
-                    "docker", "ebnf", "elixir", "elm", "erlang", "f#",
-                    "flow", "fortran", "gherkin", "glsl", "go", "graphql",
-                    "groovy", "haskell", "hcl", "html", "idris", "java",
-                    "javascript", "json", "julia", "kotlin", "latex", "less",
-                    "lisp", "livescript", "llvm ir", "lua", "makefile",
-                    "markdown", "markup", "matlab", "mathematica", "mermaid",
-                    "nix", "notion formula", "objective-c", "ocaml", "pascal",
-                    "perl", "php", "plain text", "powershell", "prolog",
-                    "protobuf", "purescript", "python", "r", "racket",
-                    "reason", "ruby", "rust", "sass", "scala", "scheme",
-                    "scss", "shell", "smalltalk", "solidity", "sql", "swift",
-                    "toml", "typescript", "vb.net", "verilog", "vhdl",
-                    "visual basic", "webassembly", "xml", "yaml", "java/c/c++/c#"
-                }
+        rest = line.lstrip('#')
+        level = min(len(line) - len(rest), MAX_NOTION_HEADING_LEVEL)  # Notion 只支持 h1-h3
+        content = rest.strip()
+        blocks.append(_heading(level, content))
+        return True
+
+    def _handle_list_item(self, line_iter: Iterator[str], line: str,
+                          blocks: List[Dict[str, Any]], markdown_dir: Path) -> bool:
+        """处理任务列表 - [ ] 和无序列表 - / *（任务列表先匹配）"""
+        match = _RE_LIST_ITEM.match(line)
+        if not match:
+            return False
 
-                # 如果语言不支持，使用 "plain text"
-                if lang.lower() not in notion_langs:
-                    lang = "plain text"
-
-                i += 1
-                code_lines = []
-                while i < len(lines) and not lines[i].strip().startswith('```'):
-                    code_lines.append(lines[i])
-                    i += 1
-                code_content = '\n'.join(code_lines)
-                blocks.append({
-                    "type": "code",
-                    "code": {
-                        "rich_text": [{"type": "text", "text": {"content": code_content}}],
-                        "language": lang
-                    }
-                })
-                i += 1
-                continue
+        content = line[match.end():]
+        if match.lastgroup == 'todo':
+            # 只看行首复选框内的标记，正文中出现的 [x] 不影响勾选状态
+            is_checked = match.group('mark') in 'xX'
+            blocks.append(_todo(content, is_checked))
+        else:
+            blocks.append(_bullet(content))
+        return True
+
+    def _handle_code(self, line_iter: Iterator[str], line: str,
+                     blocks: List[Dict[str, Any]], markdown_dir: Path) -> bool:
+        """处理代码块 ```lang ... ```"""
+        stripped = line.strip()
+        if not stripped.startswith('```'):
+            return False
 
-            # 处理引用
-            if line.startswith('>'):
-                content = line[1:].strip()
-                blocks.append({
-                    "type": "quote",
-                    "quote": {
-                        "rich_text": [{"type": "text", "text": {"content": content}}]
-                    }
-                })
-                i += 1
-                continue
+        lang = stripped[3:].strip().lower() or "plain text"
+
+        # 如果语言不支持，使用 "plain text"
+        if lang not in NOTION_CODE_LANGUAGES:
+            lang = "plain text"
+
+        # 取到结束的 ``` 为止（结束行一并跳过）；没有结束行时代码块延续到文件末尾
+        code_lines = []
+        for code_line in line_iter:
+            if code_line.strip().startswith('```'):
+                break
+            code_lines.append(code_line)
+        code_content = '\n'.join(code_lines)
+        blocks.extend(_code(lang, part) for part in _split_block_text(code_content))
+        return True
+
+    def _handle_quote(self, line_iter: Iterator[str], line: str,
+                      blocks: List[Dict[str, Any]], markdown_dir: Path) -> bool:
+        """处理引用 >"""
+        if not line.startswith('>'):
+            return False
+
+        content = line[1:].strip()
+        blocks.append(_quote(content))
+        return True
+
+    def _handle_image_line(self, line_iter: Iterator[str], line: str,
+                           blocks: List[Dict[str, Any]], markdown_dir: Path) -> bool:
+        """处理单独一行的图片"""
+        # 单独一行的图片必然以 ]] 或 ) 结尾，其余以 ! 开头的行（如图片后还有文字）不必运行正则
+        if not line.endswith((']]', ')')):
+            return False
 
-            # 处理图片 - 优先处理单独一行的图片
+        match = _RE_IMAGE_LINE.match(line)
+        if not match:
+            return False
+
+        blocks.append(self._image_block(match, markdown_dir))
+        logger.debug("  [Debug] Image block added")
+        return True
+
+    def _image_block(self, match: 're.Match[str]', markdown_dir: Path, kind: str = '') -> Dict[str, Any]:
+        """由 _RE_IMAGE_LINE 的匹配结果生成图片 block（单独一行的图片和内联图片共用）
+
+        Args:
+            match: _RE_IMAGE_LINE 的匹配结果
+            markdown_dir: markdown 文件所在目录
+            kind: 日志中的图片位置说明，如 'inline '
+        """
+        image_name = match.group('wiki')
+        if image_name is not None:
             # 格式1: ![[filename]] (Obsidian wiki-link)
-            obsidian_image_match = re.match(r'^!\[\[(.*?)\]\]$', line)
-            if obsidian_image_match:
-                image_name = obsidian_image_match.group(1)
-                print(f"  [Debug] Processing Obsidian image: {image_name}")
-                blocks.append(self._process_image_block(image_name, markdown_dir))
-                print(f"  [Debug] Image block added")
-                i += 1
-                continue
+            logger.debug("  [Debug] Processing %sObsidian image: %s", kind, image_name)
+            return self._process_image_block(image_name, markdown_dir)
+
+        # 格式2: ![alt](path) (标准 Markdown)
+        alt_text = match.group('alt')
+        image_path = match.group('path')
+        logger.debug("  [Debug] Processing %sMarkdown image: ![%s](%s)", kind, alt_text, image_path)
+        return self._process_image_block(image_path, markdown_dir)
+
+    def _handle_paragraph(self, line: str, blocks: List[Dict[str, Any]], markdown_dir: Path):
+        """处理普通段落，内联图片拆分为单独的图片 blocks"""
+        # 先用子串判断，绝大多数段落不含图片，无需运行正则
+        parts = _RE_IMAGE_INLINE.split(line) if '![' in line else None
+
+        # 没有内联图片，直接作为段落
+        if not parts or len(parts) == 1:
+            blocks.extend(_para(part) for part in _split_block_text(line.strip()))
+            return
 
-            # 格式2: ![alt](path) 或 !(path) (标准 Markdown)
-            md_image_match = re.match(r'^!\[(.*?)\]\((.*?)\)$', line)
-            if md_image_match:
-                alt_text = md_image_match.group(1)
-                image_path = md_image_match.group(2)
-                print(f"  [Debug] Processing Markdown image: ![{alt_text}]({image_path})")
-                blocks.append(self._process_image_block(image_path, markdown_dir, alt_text))
-                print(f"  [Debug] Image block added")
-                i += 1
-                continue
+        # split 一次扫描即把文本行拆开：偶数位置是文本，奇数位置是图片（从左到右）
+        for match_text in parts[1::2]:
+            # 每个图片片段都能被 _RE_IMAGE_LINE 完整匹配，与单独一行的图片同样处理
+            blocks.append(self._image_block(_RE_IMAGE_LINE.match(match_text), markdown_dir, 'inline '))
+
+        # 将所有文本部分合并为一个段落
+        combined_text = ''.join(parts[::2]).strip()
+        if combined_text:
+            blocks.extend(_para(part) for part in _split_block_text(combined_text))
+
+    # 行首字符 → 处理函数
+    _LINE_HANDLERS = {
+        '#': _handle_heading,
+        '-': _handle_list_item,
+        '*': _handle_list_item,
+        '`': _handle_code,
+        '>': _handle_quote,
+        '!': _handle_image_line,
+    }
+
+    def _http_request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                      params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """直接调用 Notion HTTP API，HTTP 错误以 httpx.HTTPStatusError 抛出
+
+        查询数据库和列出/追加/更新/删除 blocks 每个文件都要调用多次，不经过 notion_client，
+        省去它的参数整理和响应封装；使用共享的连接池，不必每次请求都重新建立 TCP/TLS 连接
 
-            # 处理内联图片 - 先提取所有内联图片，然后再处理文本
-            # 收集所有内联图片的位置
-            all_matches = []
-            for match in re.finditer(r'!\[\[.*?\]\]|!\[.*?\]\(.*?\)', line):
-                match_text = match.group(0)
-                all_matches.append((match.start(), match.end(), match_text))
-
-            # 如果有内联图片，需要特殊处理
-            if all_matches:
-                # 将文本行拆分为文本和图片的混合 blocks
-                # 先创建一个用于存储文本部分的列表
-                text_parts = []
-                last_end = 0
-
-                # 收集所有内联图片的位置
-                all_matches = []
-                for match in re.finditer(r'!\[\[.*?\]\]|!\[.*?\]\(.*?\)', line):
-                    match_text = match.group(0)
-                    all_matches.append((match.start(), match.end(), match_text))
-
-                if all_matches:
-                    # 处理每个图片和其前后的文本
-                    for start, end, match_text in sorted(all_matches):
-                        # 添加前面的文本部分
-                        if start > last_end:
-                            text_parts.append(line[last_end:start])
-
-                        # 处理图片 - 使用统一的辅助方法
-                        if match_text.startswith('![['):
-                            # Obsidian wiki-link: ![[path]]
-                            image_name = match_text[3:-2]  # 去掉 ![[ 和 ]]
-                            print(f"  [Debug] Processing inline Obsidian image: {image_name}")
-                            blocks.append(self._process_image_block(image_name, markdown_dir))
-                        else:
-                            # Markdown 图片: ![alt](path)
-                            inner = match_text[2:-1]  # 去掉 ![ 和 ]
-                            if '](' in inner:
-                                alt_text, image_path = inner.split('](', 1)
-                                image_path = image_path.rstrip(')')
-                                print(f"  [Debug] Processing inline Markdown image: ![{alt_text}]({image_path})")
-                                blocks.append(self._process_image_block(image_path, markdown_dir, alt_text))
-
-                        last_end = end
-
-                    # 添加最后的文本部分
-                    if last_end < len(line):
-                        text_parts.append(line[last_end:])
-
-                    # 将所有文本部分合并为一个段落
-                    if text_parts:
-                        combined_text = ''.join(text_parts).strip()
-                        if combined_text:
-                            blocks.append({
-                                "type": "paragraph",
-                                "paragraph": {
-                                    "rich_text": [{"type": "text", "text": {"content": combined_text}}]
-                                }
-                            })
-
-                    i += 1
-                    continue
-
-            # 处理普通段落（没有内联图片的情况）
-            if line.strip():
-                blocks.append({
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [{"type": "text", "text": {"content": line.strip()}}]
-                    }
-                })
+        Args:
+            method: HTTP 方法（GET、POST、PATCH、DELETE）
+            path: 接口路径，如 blocks/{block_id}/children
+            payload: JSON 请求体
+            params: URL 查询参数
+        """
+        if payload is None:
+            body = {}
+        elif orjson is not None:
+            # 追加 blocks 的请求体可达数百 KB；请求头中已有 Content-Type: application/json
+            body = {'content': orjson.dumps(payload)}
+        else:
+            body = {'json': payload}
+        response = self._http_client.request(method, f"{NOTION_API_BASE_URL}/{path}",
+                                             headers=self._api_headers, params=params,
+                                             timeout=HTTP_TIMEOUT_SECONDS, **body)
+        response.raise_for_status()
+        return orjson.loads(response.content) if orjson is not None else response.json()
+
+    def _query_database(self, start_cursor: Optional[str] = None) -> Dict[str, Any]:
+        """查询数据库中的一页页面（最多 QUERY_PAGE_SIZE 个）"""
+        payload = {"page_size": QUERY_PAGE_SIZE}
+        if start_cursor:
+            payload["start_cursor"] = start_cursor
+        # 只需要 file_id（和 content_hash），不必返回标题等其余属性
+        property_ids = [self._file_id_property]
+        if self._has_hash_property:
+            property_ids.append(self._hash_property)
+        params = {"filter_properties": property_ids} if all(property_ids) else None
+
+        return self._call_api(self._http_request, method="POST", path=f"databases/{self.database_id}/query",
+                              payload=payload, params=params)
+
+    def load_page_index(self) -> bool:
+        """分页读取数据库中的所有页面，建立 file_id → 页面 ID 索引
+
+        N 个文件逐个查询需要 N 次请求，一次性扫描只需 ceil(页面数/100) 次
 
-            i += 1
+        Returns:
+            是否成功建立索引（失败时 find_page_by_file_id 退回逐个查询）
+        """
+        index = {}
+        remote_hashes = {}
+        start_cursor = None
+        try:
+            while True:
+                response = self._query_database(start_cursor)
+                for page in response.get('results', []):
+                    properties = page.get('properties', {})
+                    file_id = _plain_text(properties.get('file_id', {}))
+                    if file_id and file_id not in index:
+                        index[file_id] = page['id']
+                        remote_hash = _plain_text(properties.get(CONTENT_HASH_PROPERTY, {}))
+                        if remote_hash:
+                            remote_hashes[file_id] = remote_hash
+
+                if not response.get('has_more'):
+                    break
+                start_cursor = response.get('next_cursor')
+        except Exception as e:
+            logger.warning("[Warning] Could not index existing pages, querying per file: %s", e)
+            return False
 
-        print(f"  [Debug] Total blocks generated: {len(blocks)}")
-        return blocks
+        self._page_index = index
+        self._remote_hashes = remote_hashes
+        logger.info("Indexed %s existing pages", len(index))
+        return True
 
     def find_page_by_file_id(self, database_id: str, file_id: str) -> Optional[str]:
         """在数据库中通过 file_id 查找已存在的页面
 
+        已建立索引时直接查索引，否则单独查询一次数据库
+
         Returns:
             页面 ID，如果未找到则返回 None
         """
-        print(f"  [Debug] Looking for file_id: {file_id}")
+        if self._page_index is not None:
+            return self._page_index.get(file_id)
 
-        # 方法1: 使用 databases.query (如果可用)
-        if hasattr(self.notion, 'databases') and hasattr(self.notion.databases, 'query'):
-            try:
-                print(f"  [Debug] Using databases.query() method")
-                response = self.notion.databases.query(
-                    database_id=database_id,
-                    filter={
-                        "property": "file_id",
-                        "rich_text": {
-                            "equals": file_id
-                        }
-                    }
-                )
-                results = response.get('results', [])
-                print(f"  [Debug] Found {len(results)} pages with file_id")
-
-                if results:
-                    page_id = results[0]['id']
-                    print(f"  [Debug] Existing page ID: {page_id}")
-                    return page_id
-                return None
-            except Exception as e:
-                print(f"  [Debug] databases.query failed: {e}")
+        logger.debug("  [Debug] Looking for file_id: %s", file_id)
 
-        # 方法2: 直接使用 HTTP API
-        try:
-            print(f"  [Debug] Using HTTP API directly")
-            headers = {
-                "Authorization": f"Bearer {self.token}",
-                "Notion-Version": NOTION_API_VERSION,
-                "Content-Type": "application/json"
-            }
+        import httpx
 
-            url = f"https://api.notion.com/v1/databases/{database_id}/query"
+        try:
+            path = f"databases/{database_id}/query"
             payload = {
                 "filter": {
                     "property": "file_id",
@@ -645,84 +1339,222 @@ class ObsidianToNotionSync:
                 }
             }
 
-            print(f"  [Debug] POST to {url}")
-            print(f"  [Debug] Filter: property='file_id', equals='{file_id}'")
+            logger.debug("  [Debug] POST to %s/%s", NOTION_API_BASE_URL, path)
+            logger.debug("  [Debug] Filter: property='file_id', equals='%s'", file_id)
 
-            response = httpx.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT_SECONDS)
-
-            print(f"  [Debug] Response status: {response.status_code}")
-
-            if response.status_code != 200:
-                print(f"  [Error] HTTP {response.status_code}: {response.text}")
-                return None
-
-            data = response.json()
+            data = self._call_api(self._http_request, method="POST", path=path, payload=payload)
             results = data.get('results', [])
-            print(f"  [Debug] HTTP API found {len(results)} pages")
+            logger.debug("  [Debug] HTTP API found %s pages", len(results))
 
             if results:
                 page_id = results[0]['id']
-                print(f"  [Debug] Found existing page: {page_id}")
+                logger.debug("  [Debug] Found existing page: %s", page_id)
                 return page_id
 
-            print(f"  [Debug] No existing page found with file_id")
+            logger.debug("  [Debug] No existing page found with file_id")
             return None
 
         except httpx.HTTPStatusError as e:
-            print(f"  [Error] HTTP {e.response.status_code}: {e.response.text[:200]}")
+            logger.error("  [Error] HTTP %s: %s", e.response.status_code, e.response.text[:200])
             if e.response.status_code == 400:
-                print(f"  [Info] This might mean 'file_id' property doesn't exist or can't be filtered")
+                logger.info("  [Info] This might mean 'file_id' property doesn't exist or can't be filtered")
             elif e.response.status_code == 401:
-                print(f"  [Info] Authentication failed - check NOTION_TOKEN")
+                logger.info("  [Info] Authentication failed - check NOTION_TOKEN")
             elif e.response.status_code == 403:
-                print(f"  [Info] Permission denied - check Integration capabilities")
+                logger.info("  [Info] Permission denied - check Integration capabilities")
             elif e.response.status_code == 404:
-                print(f"  [Info] Database not found - check NOTION_DATABASE_ID")
+                logger.info("  [Info] Database not found - check NOTION_DATABASE_ID")
             return None
         except httpx.TimeoutException:
-            print(f"  [Error] HTTP request timed out")
+            logger.error("  [Error] HTTP request timed out")
             return None
         except Exception as e:
-            print(f"  [Error] HTTP request failed: {type(e).__name__}: {str(e)[:200]}")
-            import traceback
-            traceback.print_exc()
+            logger.error("  [Error] HTTP request failed: %s: %s", type(e).__name__, str(e)[:200],
+                         exc_info=True)
             return None
 
+    def iter_page_blocks(self, page_id: str) -> Iterator[Dict[str, Any]]:
+        """逐页获取页面中的 blocks（自动翻页），每取到一页就立即产出"""
+        has_more = True
+        start_cursor = None
+
+        while has_more:
+            params = {"page_size": QUERY_PAGE_SIZE}
+            if start_cursor:
+                params["start_cursor"] = start_cursor
+
+            response = self._call_api(self._http_request, method="GET", path=f"blocks/{page_id}/children",
+                                      params=params)
+            yield from response.get('results', [])
+            has_more = response.get('has_more', False)
+            start_cursor = response.get('next_cursor')
+
+    def list_page_blocks(self, page_id: str) -> List[Dict[str, Any]]:
+        """获取页面中的所有 blocks（自动翻页）"""
+        return list(self.iter_page_blocks(page_id))
+
     def clear_page_blocks(self, page_id: str) -> bool:
         """删除页面中的所有 blocks
 
         Returns:
             是否成功删除
         """
+        self.cache.drop_page(page_id)
         try:
-            # 获取页面中的所有 blocks
-            blocks = []
-            has_more = True
-            start_cursor = None
-
-            while has_more:
-                params = {"block_id": page_id}
-                if start_cursor:
-                    params["start_cursor"] = start_cursor
-
-                response = self.notion.blocks.children.list(**params)
-                blocks.extend(response.get('results', []))
-                has_more = response.get('has_more', False)
-                start_cursor = response.get('next_cursor')
+            # 边翻页边删除：第一页取回后删除就开始，不必等全部列完
+            # （next_cursor 指向下一页的第一个 block，删除前面的 blocks 不影响翻页）
+            # 跳过不支持的 block 类型
+            block_ids = (
+                block['id'] for block in self.iter_page_blocks(page_id)
+                if block.get('type') != 'unsupported'
+            )
+            # 有 block 删除失败时不能算清空：接着追加会让新旧内容混在一起
+            return self._delete_blocks(block_ids)
+        except Exception as e:
+            logger.error("  [Error] Failed to clear page blocks: %s", e)
+            return False
+
+    def _delete_block(self, block_id: str) -> bool:
+        """删除单个 block，失败时只打印警告
+
+        block 已不存在或已归档（例如在 Notion 中手动删掉了，或之前已经删除过）也算删除成功，
+        不必因为一个过期的 block ID 而整页重写；临时性错误（重试后仍失败）直接抛出，
+        由调用方留到下次同步处理
+        """
+        try:
+            self._call_api(self._http_request, method="DELETE", path=f"blocks/{block_id}")
+            return True
+        except Exception as e:
+            if _is_gone_error(e):
+                logger.debug("    [Debug] Block %s already deleted", block_id)
+                return True
+            if _is_transient_error(e):
+                raise
+            logger.warning("    [Warning] Failed to delete block %s: %s", block_id, e)
+            return False
+
+    def _delete_blocks(self, block_ids: Iterable[str]) -> bool:
+        """并发删除多个 blocks，block_ids 可以是边翻页边产出的生成器
 
-            # 删除所有 blocks
-            for block in blocks:
-                if block.get('type') != 'unsupported':  # 跳过不支持的 block 类型
-                    try:
-                        self.notion.blocks.delete(block_id=block['id'])
-                    except Exception as e:
-                        print(f"    [Warning] Failed to delete block {block['id']}: {e}")
+        Returns:
+            是否全部删除成功
+        """
+        with ThreadPoolExecutor(max_workers=MAX_BLOCK_WORKERS) as executor:
+            return all(list(executor.map(_log_buffer.bind(self._delete_block), block_ids)))
+
+    def _update_blocks(self, updates: List[Tuple[str, str, Dict[str, Any]]]):
+        """并发原地更新多个 blocks（各 block 互不影响，顺序无关），任一失败时抛出异常
+
+        Args:
+            updates: [(block ID, block 类型, 新内容), ...]
+        """
+        if not updates:
+            return
+
+        with ThreadPoolExecutor(max_workers=MAX_BLOCK_WORKERS) as executor:
+            futures = [
+                executor.submit(_log_buffer.bind(self._call_api), self._http_request, method="PATCH",
+                                path=f"blocks/{block_id}", payload={block_type: content})
+                for block_id, block_type, content in updates
+            ]
+            for future in futures:
+                future.result()
+
+    def _append_blocks(self, page_id: str, blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """分批追加 blocks 到页面末尾，每批最多 100 个
+
+        同一页面的各批必须依次发送：Notion 按请求到达顺序追加，
+        并发发送会打乱 blocks 的顺序。并发来自多个页面同时同步。
 
+        Returns:
+            Notion 返回的新建 blocks（含 block ID）
+        """
+        created = []
+        for batch in self._batches(blocks):
+            response = self._call_api(
+                self._http_request,
+                idempotent=False,
+                method="PATCH",
+                path=f"blocks/{page_id}/children",
+                payload={"children": batch}
+            )
+            created.extend(response.get('results', []))
+        return created
+
+    @staticmethod
+    def _batches(blocks: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """按 Notion 单次请求上限（BLOCK_BATCH_SIZE）切分 blocks"""
+        return [blocks[i:i + BLOCK_BATCH_SIZE] for i in range(0, len(blocks), BLOCK_BATCH_SIZE)]
+
+    def sync_page_blocks(self, page_id: str, blocks: List[Dict[str, Any]]) -> bool:
+        """增量更新页面的 blocks
+
+        逐个比较页面现有 blocks 与新 blocks：内容相同的保留，类型相同的原地更新，
+        从第一个无法原地更新的位置起删除剩余旧 blocks，再追加剩余新 blocks。
+        缓存中的 block 已在 Notion 中被删除或归档时，重新列出页面的 blocks 再比较一次
+
+        Returns:
+            是否成功更新（False 表示页面与缓存或新内容对不上，需要整页重写）
+
+        Raises:
+            临时性错误（限流、5xx、网络错误）重试后仍失败时抛出，页面保留，下次同步时重新比较
+        """
+        try:
+            # 强制同步时不信任缓存（页面可能在 Notion 中被手动修改过），按页面当前的 blocks 比较
+            existing = None if self.force_sync else self.cache.get_page_blocks(page_id)
+            if existing is not None:
+                try:
+                    self._apply_block_changes(page_id, blocks, existing)
+                    return True
+                except Exception as e:
+                    if not _is_gone_error(e):
+                        raise
+                    # 缓存中的 block 已在 Notion 中被删除或归档：按页面当前的 blocks 重新比较一次
+                    logger.info("  → Cached blocks are out of date, re-reading page")
+
+            existing = [[b['id'], b['type'], block_hash(b)] for b in self.list_page_blocks(page_id)]
+            self._apply_block_changes(page_id, blocks, existing)
             return True
         except Exception as e:
-            print(f"  [Error] Failed to clear page blocks: {e}")
+            # 页面已部分更新，缓存不再可信；下次从 Notion 重新列出 blocks
+            self.cache.drop_page(page_id)
+            if _is_transient_error(e):
+                raise
+            # 缓存可能已过期（例如在 Notion 中手动修改过页面），由调用方重写
+            logger.error("  [Error] Failed to sync page blocks: %s", e)
             return False
 
+    def _apply_block_changes(self, page_id: str, blocks: List[Dict[str, Any]], existing: List[List[str]]):
+        """按页面现有 blocks [(block ID, 类型, hash), ...] 更新为新 blocks，失败时抛出异常"""
+        kept = []
+        updates = []
+        split = min(len(existing), len(blocks))
+        for index in range(split):
+            block_id, block_type, old_hash = existing[index]
+            new_block = blocks[index]
+            new_hash = block_hash(new_block)
+            if new_hash == old_hash:
+                kept.append([block_id, block_type, old_hash])
+                continue
+            if new_block['type'] != block_type or block_type not in UPDATABLE_BLOCK_TYPES:
+                split = index
+                break
+            updates.append((block_id, block_type, new_block[block_type]))
+            kept.append([block_id, block_type, new_hash])
+
+        self._update_blocks(updates)
+
+        stale_ids = [entry[0] for entry in existing[split:]]
+        if not self._delete_blocks(stale_ids):
+            raise RuntimeError("failed to delete stale blocks")
+
+        created = self._append_blocks(page_id, blocks[split:])
+        kept.extend([b['id'], b['type'], block_hash(b)] for b in created)
+        self.cache.set_page_blocks(page_id, kept)
+
+        logger.info("  → Kept %s, updated %s, deleted %s, appended %s blocks",
+                    split - len(updates), len(updates), len(stale_ids), len(blocks) - split)
+
     def update_page_blocks(self, page_id: str, blocks: List[Dict[str, Any]]) -> bool:
         """更新页面的 blocks
 
@@ -730,170 +1562,470 @@ class ObsidianToNotionSync:
             是否成功更新
         """
         try:
-            # 分批添加 blocks，每批最多 100 个
-            for i in range(0, len(blocks), 100):
-                batch = blocks[i:i+100]
-                self.notion.blocks.children.append(
-                    block_id=page_id,
-                    children=batch
-                )
+            created = self._append_blocks(page_id, blocks)
+            self.cache.set_page_blocks(page_id, [[b['id'], b['type'], block_hash(b)] for b in created])
             return True
         except Exception as e:
-            print(f"  [Error] Failed to update page blocks: {e}")
+            logger.error("  [Error] Failed to update page blocks: %s", e)
             return False
 
-    def create_or_update_page(self, markdown_file: Path):
-        """创建或更新 Notion 页面"""
-        # 生成文件的唯一 ID
-        file_id = self.generate_file_id(markdown_file)
+    def read_note(self, markdown_file: Path) -> Optional[Tuple[str, str, os.stat_result]]:
+        """读取 markdown 文件
 
-        print(f"\n📄 Processing: {markdown_file.relative_to(self.vault_path)}")
-        print(f"  [File ID: {file_id}]")
+        mtime 和 size 与上次成功同步时相同的文件不读取，直接跳过；
+        vault 中的附件在此之后有增删时不跳过，交给页面 hash 判断图片解析结果是否变化
+
+        Returns:
+            (内容, 内容 hash, 文件 stat)；读取失败或内容与上次成功同步时相同则返回 None
+        """
+        rel_path = markdown_file.relative_to(self.vault_path).as_posix()
+        record = None if self.force_sync else self.cache.get_file(rel_path)
+        if record and record['attachments_hash'] != self._vault_attachments_hash():
+            record = None
 
-        # 读取 markdown 内容
         try:
-            with open(markdown_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+            file_stat = markdown_file.stat()
+            if (record and record['mtime_ns'] == file_stat.st_mtime_ns
+                    and record['size'] == file_stat.st_size):
+                logger.info("⏭ Unchanged: %s", rel_path)
+                return None
+
+            with open(markdown_file, 'rb') as f, (
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    if file_stat.st_size >= MMAP_MIN_FILE_SIZE else nullcontext(f.read())) as data:
+                # 按原始字节计算 hash，内容没变的文件不必解码
+                content_hash = self._content_hash(data)
+                if record and record['content_hash'] == content_hash:
+                    self.cache.touch_file(rel_path, file_stat)
+                    logger.info("⏭ Unchanged: %s", rel_path)
+                    return None
+
+                content = str(data, 'utf-8')
         except Exception as e:
-            print(f"  ✗ Failed to read file: {e}")
-            return
+            logger.info("\n📄 Processing: %s", rel_path)
+            logger.error("  ✗ Failed to read file: %s", e)
+            return None
+
+        # 与文本模式读取一致，统一换行符
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+
+        return content, content_hash, file_stat
+
+    def parse_note(self, markdown_file: Path, content: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """解析 markdown 内容
 
+        Returns:
+            (页面标题, Notion blocks)
+        """
         # 获取标题（文件名或第一个 # 标题）
         title = markdown_file.stem
-        first_line = content.split('\n')[0].strip()
+        # 只取第一行，避免为整个文件生成行列表
+        first_line = content.partition('\n')[0].strip()
         if first_line.startswith('#'):
             title = first_line.lstrip('#').strip()
 
-        # 转换为 Notion blocks
+        # 去掉 YAML frontmatter 后转换为 Notion blocks
         markdown_dir = markdown_file.parent
-        blocks = self.convert_obsidian_to_notion_blocks(content, markdown_dir)
+        body = self._strip_frontmatter(content)
+        # 图片按笔记所在目录解析，所以目录也是缓存键的一部分
+        key = (markdown_dir, body)
+        blocks = self._blocks_cache.get(key)
+        if blocks is None:
+            # read_note 已把换行统一为 \n；不用 splitlines()，它还会在 \x0c、U+2028 等字符处断行
+            lines = body.split('\n')
+            if not lines[-1]:
+                lines.pop()  # 末尾的换行不算一个空行（否则未闭合的代码块会多出一个换行）
+            blocks = self._blocks_cache[key] = self.convert_obsidian_to_notion_blocks(lines, markdown_dir)
+        return title, blocks
+
+    @staticmethod
+    def _strip_frontmatter(content: str) -> str:
+        """去掉文件开头的 YAML frontmatter（--- ... ---）
+
+        直接在原始文本上用 str.find 定位结束分隔行，不必逐行比较；
+        没有找到结束分隔行时按普通正文处理
+        """
+        first_newline = content.find('\n')
+        if first_newline == -1 or content[:first_newline].rstrip() != '---':
+            return content
+
+        end = content.find('\n---', first_newline)
+        while end != -1:
+            line_end = content.find('\n', end + 1)
+            if line_end == -1:
+                line_end = len(content)
+            if content[end + 1:line_end].rstrip() == '---':
+                return content[line_end + 1:]
+            end = content.find('\n---', end + 1)
+
+        return content
+
+    def parse_notes(self, notes: List[Tuple[Path, str]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """批量解析 markdown 内容，结果顺序与输入一致
+
+        解析是纯 CPU 工作，文件较多时分发到多个子进程并行执行
+
+        Args:
+            notes: [(文件路径, 内容), ...]
+        """
+        if len(notes) >= PARSE_POOL_MIN_FILES:
+            # 先在主进程建好文件索引，随实例一起传给子进程，避免每个子进程各扫描一遍 vault
+            self._vault_file_index()
+            try:
+                with ProcessPoolExecutor(initializer=_init_parse_worker, initargs=(self,)) as executor:
+                    return list(executor.map(_parse_note_job, notes, chunksize=PARSE_POOL_CHUNK_SIZE))
+            except Exception as e:
+                logger.warning("[Warning] Parallel parsing unavailable, parsing serially: %s", e)
+
+        return [self.parse_note(markdown_file, content) for markdown_file, content in notes]
+
+    def create_or_update_page(self, markdown_file: Path, content_hash: str,
+                              file_stat: os.stat_result, parsed: Tuple[str, List[Dict[str, Any]]]):
+        """创建或更新 Notion 页面
+
+        Args:
+            markdown_file: markdown 文件路径
+            content_hash: 文件内容 hash（同步成功后写入状态库）
+            file_stat: 读取文件时的 stat（同步成功后写入状态库）
+            parsed: parse_note 的结果 (页面标题, Notion blocks)
+        """
+        # 生成文件的唯一 ID
+        file_id = self.generate_file_id(markdown_file)
+        rel_path = markdown_file.relative_to(self.vault_path).as_posix()
+        title, blocks = parsed
+        attachments_hash = self._vault_attachments_hash()
+
+        logger.info("\n📄 Processing: %s", rel_path)
+        logger.info("  [File ID: %s]", file_id)
 
         if not blocks:
-            print(f"  ⚠ No content blocks found, skipping")
+            logger.warning("  ⚠ No content blocks found, skipping")
+            self.cache.set_file(rel_path, file_stat, content_hash, file_id, None, None, attachments_hash)
             return
 
-        print(f"  → Generated {len(blocks)} blocks")
+        logger.info("  → Generated %s blocks", len(blocks))
 
-        # 检查页面是否已存在（通过 file_id）
-        existing_page_id = self.find_page_by_file_id(self.database_id, file_id)
+        # 生成的页面与上次同步的完全相同时，不必调用 Notion API
+        blocks_hash = page_hash(title, blocks)
+        record = self.cache.get_file(rel_path)
+        if (not self.force_sync and record and record['page_id']
+                and record['blocks_hash'] == blocks_hash):
+            logger.info("  ⏭ Page content unchanged, skipping")
+            self.cache.set_file(rel_path, file_stat, content_hash, file_id, record['page_id'], blocks_hash,
+                                attachments_hash)
+            return
+
+        # 检查页面是否已存在（通过 file_id）；
+        # 上次同步记下的页面 ID 可以省去一次查询，已建立索引时以索引为准
+        cached_page_id = record['page_id'] if record and self._page_index is None else None
+        existing_page_id = cached_page_id or self.find_page_by_file_id(self.database_id, file_id)
+
+        # 本地没有记录（如状态库丢失）时，再和页面上记录的 content_hash 比较
+        if (existing_page_id and not self.force_sync
+                and self._remote_hashes.get(file_id) == blocks_hash):
+            logger.info("  ⏭ Page content unchanged, skipping")
+            self.cache.set_file(rel_path, file_stat, content_hash, file_id, existing_page_id, blocks_hash,
+                                attachments_hash)
+            return
 
         if existing_page_id:
-            print(f"  ✓ Found existing page: {existing_page_id}")
-            print(f"  → Updating page: '{title}'")
+            logger.info("  ✓ Found existing page: %s", existing_page_id)
+            logger.info("  → Updating page: '%s'", title)
 
-            # 删除页面中的所有现有 blocks
-            if not self.clear_page_blocks(existing_page_id):
-                print(f"  ✗ Failed to clear existing blocks")
+            # 增量更新；页面与缓存对不上时退回到整页重写，临时性错误则留到下次同步
+            try:
+                updated = self.sync_page_blocks(existing_page_id, blocks)
+            except Exception as e:
+                logger.error("  ✗ Failed to update page, will retry on next sync: %s", e)
                 return
 
-            print(f"  → Cleared existing blocks")
+            if updated:
+                if self._has_hash_property:
+                    self._update_page_properties(existing_page_id, file_id, title, blocks_hash)
+            else:
+                logger.info("  → Incremental update failed, rewriting page")
+                existing_page_id = self.rewrite_page(existing_page_id, file_id, title, blocks, blocks_hash)
+                if not existing_page_id:
+                    # 原页面仍然保留，状态不变，下次同步时重试
+                    return
+
+            self.cache.set_file(rel_path, file_stat, content_hash, file_id, existing_page_id, blocks_hash,
+                                attachments_hash)
+            logger.info("  ✅ Updated page: %s", existing_page_id)
+        else:
+            logger.info("  → Creating new page: '%s'", title)
+            try:
+                page_id = self._create_page(file_id, title, blocks, blocks_hash)
+                self.cache.set_file(rel_path, file_stat, content_hash, file_id, page_id, blocks_hash,
+                                    attachments_hash)
+                logger.info("  ✅ Created page: %s", page_id)
+            except Exception as e:
+                logger.error("  ✗ Failed to create page: %s", e)
+
+    def _page_properties(self, file_id: str, title: str, blocks_hash: str) -> Dict[str, Any]:
+        """页面属性：标题、file_id，数据库有 content_hash 属性时再加上页面 hash"""
+        properties = {
+            "Name": {
+                "title": [{"text": {"content": title}}]
+            },
+            "file_id": {
+                "rich_text": [{"text": {"content": file_id}}]
+            }
+        }
+        if self._has_hash_property:
+            properties[CONTENT_HASH_PROPERTY] = {"rich_text": [{"text": {"content": blocks_hash}}]}
+        return properties
 
-            # 添加新的 blocks
-            if not self.update_page_blocks(existing_page_id, blocks):
-                print(f"  ✗ Failed to add new blocks")
-                return
+    def _update_page_properties(self, page_id: str, file_id: str, title: str, blocks_hash: str):
+        """页面内容更新成功后更新属性（标题和 content_hash）
 
-            if len(blocks) > 100:
-                print(f"  → Added {len(blocks)} blocks in {(len(blocks) + 99) // 100} batches")
-            else:
-                print(f"  → Added {len(blocks)} blocks")
+        失败时只打印警告：页面上的 hash 与内容不一致只会让下次同步多比较一次
+        """
+        try:
+            self._call_api(self.notion.pages.update, page_id=page_id,
+                           properties=self._page_properties(file_id, title, blocks_hash))
+        except Exception as e:
+            logger.warning("  [Warning] Could not update page properties: %s", e)
 
-            print(f"  ✅ Updated page: {existing_page_id}")
-        else:
-            print(f"  → Creating new page: '{title}'")
+    def _sync_note(self, *args):
+        """在同步线程中调用 create_or_update_page，该文件的日志整段输出"""
+        with _log_buffer.capture():
+            self.create_or_update_page(*args)
+
+    def _create_page(self, file_id: str, title: str, blocks: List[Dict[str, Any]], blocks_hash: str) -> str:
+        """在数据库中创建页面，失败时抛出异常
+
+        分批创建：第一批随页面一起创建，其余批次依次追加
+
+        Returns:
+            新页面 ID
+        """
+        batches = self._batches(blocks)
+        page = self._call_api(
+            self.notion.pages.create,
+            idempotent=False,
+            parent={"database_id": self.database_id},
+            properties=self._page_properties(file_id, title, blocks_hash),
+            children=batches[0]
+        )
+
+        # 如果有更多 blocks，分批添加；失败时归档只写了一部分的新页面，不留下内容不全的页面
+        if len(batches) > 1:
+            try:
+                created = self._append_blocks(page['id'], blocks[BLOCK_BATCH_SIZE:])
+            except Exception:
+                self._archive_page(page['id'])
+                raise
+            logger.info("  → Added %s additional blocks", len(created))
+
+        if self._page_index is not None:
+            self._page_index[file_id] = page['id']
+        return page['id']
+
+    def _archive_page(self, page_id: str) -> bool:
+        """归档页面，页面已不存在时也算成功；失败时只打印警告"""
+        try:
+            self._call_api(self.notion.pages.update, page_id=page_id, archived=True)
+            return True
+        except Exception as e:
+            if _error_status(e) == 404:
+                return True
+            logger.warning("  [Warning] Failed to archive page %s: %s", page_id, e)
+            return False
+
+    def rewrite_page(self, page_id: str, file_id: str, title: str,
+                     blocks: List[Dict[str, Any]], blocks_hash: str) -> Optional[str]:
+        """整页重写页面内容
+
+        默认新建页面后归档旧页面：几次请求代替逐个删除旧 blocks。
+        先建新页面、成功后才归档旧页面，任何一步失败时旧页面都原样保留。
+        设置 SYNC_PRESERVE_PAGE_ID=1 时保留原页面，并发删除旧 blocks 后重新添加。
+
+        Returns:
+            重写后的页面 ID（重建时为新页面 ID），失败返回 None
+        """
+        if not self.preserve_page_id:
             try:
-                # 分批创建，每批最多 100 个 blocks
-                page = self.notion.pages.create(
-                    parent={"database_id": self.database_id},
-                    properties={
-                        "Name": {
-                            "title": [{"text": {"content": title}}]
-                        },
-                        "file_id": {
-                            "rich_text": [{"text": {"content": file_id}}]
-                        }
-                    },
-                    children=blocks[:100]
-                )
-
-                # 如果有更多 blocks，分批添加
-                if len(blocks) > 100:
-                    page_id = page['id']
-                    for i in range(100, len(blocks), 100):
-                        self.notion.blocks.children.append(
-                            block_id=page_id,
-                            children=blocks[i:i+100]
-                        )
-                    print(f"  → Added {len(blocks) - 100} additional blocks")
-
-                print(f"  ✅ Created page: {page['id']}")
+                new_page_id = self._create_page(file_id, title, blocks, blocks_hash)
             except Exception as e:
-                print(f"  ✗ Failed to create page: {e}")
+                logger.error("  ✗ Failed to recreate page: %s", e)
+                return None
 
-    def run(self):
-        """主函数：遍历所有 markdown 文件并同步"""
-        print(f"\n{'='*50}")
-        print(f"Obsidian → Notion Sync (with file_id matching)")
-        print(f"{'='*50}")
-        print(f"Source: {self.vault_path}")
-        print(f"Database: {self.database_id}")
+            if not self._archive_page(page_id):
+                # 旧页面还在：撤掉新页面，避免两个页面带同一个 file_id
+                self._archive_page(new_page_id)
+                if self._page_index is not None:
+                    self._page_index[file_id] = page_id
+                logger.error("  ✗ Failed to archive old page, keeping it")
+                return None
+
+            self.cache.drop_page(page_id)
+            logger.info("  → Recreated page and archived the old one: %s", new_page_id)
+            return new_page_id
+
+        # 删除页面中的所有现有 blocks
+        if not self.clear_page_blocks(page_id):
+            logger.error("  ✗ Failed to clear existing blocks")
+            return None
+
+        logger.info("  → Cleared existing blocks")
 
-        # 诊断：使用 HTTP API 打印数据库结构
+        # 添加新的 blocks
+        if not self.update_page_blocks(page_id, blocks):
+            logger.error("  ✗ Failed to add new blocks")
+            return None
+
+        if len(blocks) > BLOCK_BATCH_SIZE:
+            logger.info("  → Added %s blocks in %s batches", len(blocks), len(self._batches(blocks)))
+        else:
+            logger.info("  → Added %s blocks", len(blocks))
+
+        if self._has_hash_property:
+            self._update_page_properties(page_id, file_id, title, blocks_hash)
+        return page_id
+
+    def check_database_schema(self):
+        """检查数据库结构，记下 file_id 和 content_hash 属性的 ID
+
+        结构很少变化：检查结果保存在同步状态中，SCHEMA_CACHE_TTL_SECONDS 内直接使用，
+        省去一次请求；设置 SYNC_VERIFY_SCHEMA=1 时重新读取
+        """
+        cached = None if self.verify_schema else self.cache.get_meta('schema')
+        if cached:
+            schema = json.loads(cached)
+            age = time.time() - schema['checked_at']
+            if 0 <= age < SCHEMA_CACHE_TTL_SECONDS:
+                logger.info("\nDatabase structure checked %.1fh ago (set SYNC_VERIFY_SCHEMA=1 to re-check)",
+                            age / 3600)
+                self._use_database_properties(schema['properties'])
+                return
+
+        # 诊断：使用 HTTP API 打印数据库结构（与同步共用连接池，建立的连接之后继续使用）
         try:
-            headers = {
-                "Authorization": f"Bearer {self.token}",
-                "Notion-Version": NOTION_API_VERSION,
-                "Content-Type": "application/json"
-            }
-            url = f"https://api.notion.com/v1/databases/{self.database_id}"
-            response = httpx.get(url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
-
-            if response.status_code == 200:
-                db = response.json()
-                print(f"\n[Debug] Database structure:")
-                title = db.get('title', [{}])[0].get('plain_text', 'N/A') if db.get('title') else 'N/A'
-                print(f"  Title: {title}")
-                props = db.get('properties', {})
-                print(f"  Properties ({len(props)}):")
-                for prop_name, prop_data in props.items():
-                    prop_type = prop_data.get('type', 'unknown')
-                    print(f"    - '{prop_name}' (type: {prop_type})")
-
-                # 检查是否有 file_id 属性
-                if 'file_id' not in props:
-                    print(f"\n  ⚠️  WARNING: 'file_id' property not found!")
-                    print(f"  Please add a 'file_id' property (type: rich_text) to your database")
-                else:
-                    print(f"\n  ✅ 'file_id' property found")
-            else:
-                print(f"\n[Warning] Could not retrieve database structure: HTTP {response.status_code}")
+            db = self._call_api(self._http_request, method="GET", path=f"databases/{self.database_id}")
         except Exception as e:
-            print(f"\n[Warning] Could not retrieve database structure: {e}")
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            logger.warning("\n[Warning] Could not retrieve database structure: %s", f"HTTP {status}" if status else e)
+            return
 
-        print(f"{'='*50}\n")
+        logger.info("\nDatabase structure:")
+        title = db.get('title', [{}])[0].get('plain_text', 'N/A') if db.get('title') else 'N/A'
+        logger.info("  Title: %s", title)
+        props = db.get('properties', {})
+        logger.info("  Properties (%s):", len(props))
+        for prop_name, prop_data in props.items():
+            prop_type = prop_data.get('type', 'unknown')
+            logger.info("    - '%s' (type: %s)", prop_name, prop_type)
+
+        self._use_database_properties(props)
+
+        # 检查是否有 file_id 属性
+        if 'file_id' not in props:
+            logger.warning("\n  ⚠️  WARNING: 'file_id' property not found!")
+            logger.warning("  Please add a 'file_id' property (type: rich_text) to your database")
+        else:
+            logger.info("\n  ✅ 'file_id' property found")
+            # 结构正确时才缓存，补上 file_id 属性后下次运行会重新检查
+            self.cache.set_meta('schema', json.dumps({
+                'checked_at': time.time(),
+                'properties': {
+                    name: {'id': prop.get('id'), 'type': prop.get('type')}
+                    for name, prop in props.items()
+                }
+            }))
 
-        # 查找所有 .md 文件
-        markdown_files = list(self.vault_path.rglob('*.md'))
+        if self._has_hash_property:
+            logger.info("  ✅ '%s' property found, page hashes are kept in Notion", CONTENT_HASH_PROPERTY)
 
-        # 过滤掉 .obsidian 和其他系统文件夹
-        excluded_paths = ['.obsidian', '.git', '.github', 'node_modules']
-        markdown_files = [
-            f for f in markdown_files
-            if not any(excluded in str(f) for excluded in excluded_paths)
-        ]
+    def _use_database_properties(self, props: Dict[str, Any]):
+        """从数据库属性中记下 file_id 和（可选的）content_hash 属性的 ID"""
+        # 属性 ID 本身已是 URL 编码形式（如 %3AUPp），作为查询参数发送前先还原
+        property_id = props.get('file_id', {}).get('id')
+        self._file_id_property = unquote(property_id) if property_id else None
 
-        print(f"Found {len(markdown_files)} markdown files\n")
+        hash_prop = props.get(CONTENT_HASH_PROPERTY)
+        if hash_prop and hash_prop.get('type') == 'rich_text':
+            self._has_hash_property = True
+            property_id = hash_prop.get('id')
+            self._hash_property = unquote(property_id) if property_id else None
 
-        for md_file in markdown_files:
-            self.create_or_update_page(md_file)
+    def find_markdown_files(self) -> List[Path]:
+        """查找 vault 中所有 .md 文件
 
-        print(f"\n{'='*50}")
-        print(f"Sync completed!")
-        print(f"{'='*50}\n")
+        遍历时直接剪掉 .obsidian、.git 等系统文件夹，不会进入其中
+        （.git/objects 可能有成千上万个文件）；同时建立图片查找用的文件索引
+        """
+        return [self.vault_path / rel_path for rel_path in self._scan_vault()]
+
+    def run(self):
+        """主函数：遍历所有 markdown 文件并同步"""
+        logger.info("\n%s", SEPARATOR)
+        logger.info("Obsidian → Notion Sync (with file_id matching)")
+        logger.info(SEPARATOR)
+        logger.info("Source: %s", self.vault_path)
+        logger.info("Database: %s", self.database_id)
+
+        # 同步缓存和连接池在 __init__ 中创建，之后任一步骤（读取数据库结构、建立文件索引、解析等）
+        # 出错都要关闭它们
+        try:
+            self.check_database_schema()
+
+            logger.info("%s\n", SEPARATOR)
+
+            # 查找所有 .md 文件
+            markdown_files = self.find_markdown_files()
+
+            logger.info("Found %s markdown files\n", len(markdown_files))
+
+            # 忘掉已删除或改名的文件（Notion 中的页面保留不动）
+            pruned = self.cache.prune(md_file.relative_to(self.vault_path).as_posix() for md_file in markdown_files)
+            if pruned:
+                logger.debug("[Debug] Removed %s deleted files from sync state", pruned)
+
+            # 读取文件，跳过内容未变化的文件（读文件和计算 hash 都会释放 GIL，用线程并发）
+            pending_files = []
+            contents = []
+            content_hashes = []
+            file_stats = []
+            with ThreadPoolExecutor(max_workers=self.sync_workers) as executor:
+                notes = list(executor.map(self.read_note, markdown_files))
+            for md_file, note in zip(markdown_files, notes):
+                if note:
+                    pending_files.append(md_file)
+                    contents.append(note[0])
+                    content_hashes.append(note[1])
+                    file_stats.append(note[2])
+
+            # 解析为 Notion blocks（纯 CPU，与网络同步分开）
+            parsed_notes = self.parse_notes(list(zip(pending_files, contents)))
+
+            # 记下了页面 ID 的文件不必查询；需要查询的文件较多时一次性建立 file_id 索引，代替逐个查询
+            lookups = 0
+            for md_file in pending_files:
+                record = self.cache.get_file(md_file.relative_to(self.vault_path).as_posix())
+                if not (record and record['page_id']):
+                    lookups += 1
+            if lookups >= PAGE_INDEX_MIN_FILES:
+                self.load_page_index()
+
+            # 每个文件的同步几乎都在等待网络，多线程并发处理
+            with ThreadPoolExecutor(max_workers=self.sync_workers) as executor:
+                list(executor.map(self._sync_note, pending_files, content_hashes,
+                                  file_stats, parsed_notes))
+        finally:
+            self.cache.close()
+            self._http_client.close()
+
+        logger.info("\n%s", SEPARATOR)
+        logger.info("Sync completed!")
+        logger.info("%s\n", SEPARATOR)
 
 
 def main():
     """主入口函数"""
+    setup_logging()
+
     # 从环境变量获取配置
     NOTION_TOKEN = os.environ.get('NOTION_TOKEN')
     NOTION_DATABASE_ID = os.environ.get('NOTION_DATABASE_ID')
@@ -901,13 +2033,13 @@ def main():
 
     # 验证配置
     if not NOTION_TOKEN:
-        print("Error: NOTION_TOKEN environment variable not set")
-        print("Please add it as a GitHub Secret")
+        logger.error("Error: NOTION_TOKEN environment variable not set")
+        logger.error("Please add it as a GitHub Secret")
         sys.exit(1)
 
     if not NOTION_DATABASE_ID:
-        print("Error: NOTION_DATABASE_ID environment variable not set")
-        print("Please add it as a GitHub Secret")
+        logger.error("Error: NOTION_DATABASE_ID environment variable not set")
+        logger.error("Please add it as a GitHub Secret")
         sys.exit(1)
 
     # 执行同步
@@ -10,15 +10,12 @@ try:
     from notion_client import Client
     import httpx
 except ImportError:
-    print("Installing required packages...")
-    import subprocess
-    subprocess.run([sys.executable, "-m", "pip", "install", "notion-client", "httpx"])
-    from notion_client import Client
-    import httpx
+    print("Error: notion-client not installed. Run: pip install -r .github/scripts/requirements.txt")
+    sys.exit(1)
 
-# 从环境变量获取配置
-NOTION_TOKEN = os.environ.get('NOTION_TOKEN', input('Enter NOTION_TOKEN: '))
-NOTION_DATABASE_ID = os.environ.get('NOTION_DATABASE_ID', input('Enter NOTION_DATABASE_ID: '))
+# 从环境变量获取配置（未设置时才提示输入）
+NOTION_TOKEN = os.environ.get('NOTION_TOKEN') or input('Enter NOTION_TOKEN: ')
+NOTION_DATABASE_ID = os.environ.get('NOTION_DATABASE_ID') or input('Enter NOTION_DATABASE_ID: ')
 
 print(f"\n{'='*50}")
 print(f"Notion Database Connection Test")
@@ -27,10 +24,13 @@ print(f"Token: {NOTION_TOKEN[:20]}...{NOTION_TOKEN[-10:]}")
 print(f"Database ID: {NOTION_DATABASE_ID}")
 print(f"{'='*50}\n")
 
+# 两个测试共用一个连接，第二个测试不必重新建立 TCP/TLS 连接
+http_client = httpx.Client(timeout=30.0)
+
 # 方法1: 使用 notion_client
 print("[Test 1] Using notion_client to retrieve database...")
 try:
-    notion = Client(auth=NOTION_TOKEN)
+    notion = Client(auth=NOTION_TOKEN, client=http_client)
     db = notion.databases.retrieve(NOTION_DATABASE_ID)
     print(f"✅ Success!")
     print(f"  Title: {db.get('title', [{}])[0].get('plain_text', 'N/A')}")
@@ -52,7 +52,7 @@ try:
     }
 
     url = f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}"
-    response = httpx.get(url, headers=headers, timeout=30.0)
+    response = http_client.get(url, headers=headers)
 
     if response.status_code == 200:
         data = response.json()
@@ -68,6 +68,8 @@ try:
 except Exception as e:
     print(f"❌ Failed: {e}")
 
+http_client.close()
+
 print(f"\n{'='*50}")
 print(f"If you see 'Properties (0)' or connection errors,")
 print(f"please check:")